@@ -1,10 +1,21 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
-import pandas as pd
 import os
 import numpy as np
 from dotenv import load_dotenv
 
+from data_store import DatasetReloader, get_store, nearest_county, peek_store, reload_store
+from pagination import PaginationError, keyset_page, offset_page, parse_fields, project
+from stats_engine import AGGREGATE_METRICS, DIMENSIONS, group_aggregate
+from spatial_index import CLUSTER_MAX_ZOOM, cluster_points, parse_bbox, parse_point, parse_radius, parse_zoom
+from tiles import TileCache, validate_tile
+from columnar import columnar_systems, parse_format
+from timeseries import get_timeseries
+from lcr import ACTION_LEVELS, get_lcr, parse_contaminant, parse_trend
+from response_cache import ResponseCache
+from query_filters import filter_key, parse_active, parse_filters, select_all_systems, select_systems
+from export import EXPORT_FORMATS, generate_export, gzip_stream, parse_export_format
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -12,143 +23,357 @@ CORS(app)
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
-# Cache for polished data
-map_data_cache = None
+# Encoded map tiles, keyed by dataset version so a reload never serves stale tiles
+tile_cache = TileCache(max_tiles=int(os.getenv('TILE_CACHE_SIZE', '4096')))
+
+# Most systems /api/nearby returns per request
+MAX_NEARBY = 100
+
+# Default page size of /api/lead-copper
+LEAD_COPPER_PAGE = 50
+
+# Encoded JSON responses per endpoint, parameters and dataset version
+response_cache = ResponseCache(max_items=int(os.getenv('RESPONSE_CACHE_SIZE', '256')))
+
+# Build the in-memory store at startup so the first request doesn't pay for the CSV parse
+try:
+    get_store()
+except Exception as e:
+    print(f"Error loading polished data: {e}")
+
+# Pick up new polished_data.csv files written by preprocess_data.py without a restart
+# (set DATASET_RELOAD_INTERVAL=0 to disable)
+dataset_reloader = DatasetReloader(interval=float(os.getenv('DATASET_RELOAD_INTERVAL', '2')))
+if dataset_reloader.interval > 0:
+    dataset_reloader.start()
+
+@app.after_request
+def add_dataset_version(response):
+    store = peek_store()
+    if store is not None:
+        response.headers['X-Dataset-Version'] = store.version
+    return response
+
+def cached_json(store, build, key=None):
+    """Respond with build()'s payload, encoded once per dataset version and key (the query string by default)"""
+    if key is None:
+        key = tuple(sorted(request.args.items(multi=True)))
+    return response_cache.respond(request, (request.path, store.version, key), build)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "message": "Flask backend is running"})
 
+@app.route('/api/dataset', methods=['GET'])
+def get_dataset_info():
+    """Get the version of the dataset currently being served"""
+    try:
+        return jsonify(get_store().describe())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/water-systems', methods=['GET'])
 def get_water_systems():
     try:
         limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')
+        
+        # Slice the preloaded active systems, serializing only the requested page and fields
+        store = get_store()
+        fields = parse_fields(request.args.get('fields'), store.fields)
+        
+        def build():
+            start, end, next_cursor = keyset_page(store.columns['pwsid'], cursor, limit)
+            limited_systems = project(store.systems[start:end], fields)
+            return {
+                "total": len(store.systems),
+                "count": len(limited_systems),
+                "systems": limited_systems,
+                "next_cursor": next_cursor,
+                "data_source": "polished_sdwis"
+            }
         
-        # Load from polished data
-        all_systems = load_polished_data()
-        limited_systems = all_systems[:limit]
+        return cached_json(store, build)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+
+
+@app.route('/api/water-systems/<pwsid>/trend', methods=['GET'])
+def get_water_system_trend(pwsid):
+    """Quarterly population, violation counts and risk level for one system"""
+    try:
+        timeseries = get_timeseries()
+        points = timeseries.trend(pwsid)
+        if not points:
+            return jsonify({"error": f"No quarterly history for {pwsid}"}), 404
         
         return jsonify({
-            "total": len(all_systems),
-            "count": len(limited_systems),
-            "systems": limited_systems,
-            "data_source": "polished_sdwis"
+            "pwsid": pwsid.strip().upper(),
+            "quarters_available": timeseries.quarters,
+            "points": points,
+            "data_source": "sdwis_quarterly_timeseries"
         })
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/water-systems/<pwsid>/lead-copper', methods=['GET'])
+def get_water_system_lead_copper(pwsid):
+    """Latest lead and copper 90th percentiles, action level exceedances and trend for one system"""
+    try:
+        lcr = get_lcr()
+        row = lcr.find(pwsid)
+        if row is None:
+            return jsonify({"error": f"No lead and copper results for {pwsid}"}), 404
+        
+        return cached_json(lcr, lambda: {
+            **lcr.records([row])[0],
+            "action_levels_mg_l": {"lead": ACTION_LEVELS['PB90'], "copper": ACTION_LEVELS['CU90']},
+            "data_source": "sdwis_lcr_samples"
+        })
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-
+@app.route('/api/lead-copper', methods=['GET'])
+def get_lead_copper():
+    """Systems with lead and copper results, worst latest result (relative to its action level) first"""
+    try:
+        contaminant = parse_contaminant(request.args.get('contaminant'))
+        trend = parse_trend(request.args.get('trend'))
+        exceeding = request.args.get('exceeding', 'false').lower() == 'true'
+        limit = int(request.args.get('limit', LEAD_COPPER_PAGE))
+        cursor = request.args.get('cursor')
+        
+        # Encoded once per summary version and query; only the requested page is decoded
+        lcr = get_lcr()
+        
+        def build():
+            rows = lcr.rank(contaminant, exceeding=exceeding, trend=trend)
+            query_key = repr((contaminant, trend, exceeding))
+            start, end, next_cursor = offset_page(len(rows), cursor, limit, lcr.version, query_key)
+            return {
+                "total": len(rows),
+                "count": end - start,
+                "systems": lcr.records(rows[start:end]),
+                "next_cursor": next_cursor,
+                "action_levels_mg_l": {"lead": ACTION_LEVELS['PB90'], "copper": ACTION_LEVELS['CU90']},
+                "data_source": "sdwis_lcr_samples"
+            }
+        
+        return cached_json(lcr, build)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/stats/water-systems', methods=['GET'])
 def get_water_system_stats():
     try:
-        systems = load_polished_data()
-        
-        # Calculate statistics from polished data (active systems only)
-        total_pop = sum(s['population'] for s in systems)
-        systems_by_type = {}
-        systems_by_risk = {}
-        
-        # Use current_violations (unaddressed) for compliance calculations
-        current_violations_total = sum(s.get('current_violations', s.get('unaddressed_violations', 0)) for s in systems)
-        systems_with_current_violations = len([s for s in systems if s.get('current_violations', s.get('unaddressed_violations', 0)) > 0])
-        
-        for system in systems:
-            # Count by type
-            sys_type = system['type']
-            systems_by_type[sys_type] = systems_by_type.get(sys_type, 0) + 1
-            
-            # Count by risk level (recalculated based on current violations)
-            risk = system['risk_level']
-            systems_by_risk[risk] = systems_by_risk.get(risk, 0) + 1
-        
-        stats = {
-            "total_systems": len(systems),
-            "systems_by_type": systems_by_type,
-            "systems_by_risk": systems_by_risk,
-            "population_served": total_pop,
-            "avg_population_per_system": round(total_pop / len(systems)) if systems else 0,
-            "total_violations": current_violations_total,  # Using current violations only
-            "systems_with_violations": systems_with_current_violations,  # Using current violations only
-            "compliance_note": "Statistics based on active systems and current (unaddressed) violations only",
-            "data_source": "polished_sdwis_active_only"
-        }
-        
-        return jsonify(stats)
+        # Aggregates are computed when the dataset loads
+        store = get_store()
+        return cached_json(store, lambda: store.stats.water_systems)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/search/water-systems', methods=['GET'])
 def search_water_systems():
     try:
-        query = request.args.get('q', '').strip().lower()
-        risk_level = request.args.get('risk', '').strip()
+        filters = parse_filters(request.args)
+        query = filters['q']
+        risk_level = filters['risk']
+        fuzzy = filters['fuzzy']
         limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')
         
-        systems = load_polished_data()
-        
-        # Filter data
-        filtered_systems = systems
+        store = get_store()
+        fields = parse_fields(request.args.get('fields'), store.fields)
         
-        if query:
-            # Search in system name and address
-            filtered_systems = [
-                s for s in filtered_systems 
-                if query in s['name'].lower() or query in s['address'].lower()
-            ]
-        
-        if risk_level:
-            filtered_systems = [
-                s for s in filtered_systems 
-                if s['risk_level'].lower() == risk_level.lower()
-            ]
-        
-        # Get results with limit
-        results = filtered_systems[:limit]
+        def build():
+            # Ranked matches from the prebuilt search index
+            matches, corrections = select_systems(store, filters)
+            
+            # Get the requested page of results
+            query_key = repr(filter_key(filters))
+            start, end, next_cursor = offset_page(len(matches), cursor, limit, store.version, query_key)
+            results = project([store.systems[i] for i in matches[start:end]], fields)
+            return {
+                "total": len(matches),
+                "count": len(results),
+                "query": query,
+                "risk_level": risk_level,
+                "fuzzy": fuzzy,
+                "corrections": corrections,
+                "systems": results,
+                "next_cursor": next_cursor,
+                "data_source": "polished_sdwis"
+            }
         
-        return jsonify({
-            "total": len(filtered_systems),
-            "count": len(results),
-            "query": query,
-            "risk_level": risk_level,
-            "systems": results,
-            "data_source": "polished_sdwis"
-        })
+        return cached_json(store, build)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/aggregate', methods=['GET'])
+def get_aggregate():
+    """Group active systems by one or more dimensions and compute metrics per group"""
+    try:
+        group_by = [g.strip() for g in request.args.get('group_by', 'county').split(',') if g.strip()]
+        metrics = [m.strip() for m in request.args.get('metrics', 'count').split(',') if m.strip()]
+        unknown = [g for g in group_by if g not in DIMENSIONS] + [m for m in metrics if m not in AGGREGATE_METRICS]
+        if not group_by or not metrics or unknown:
+            return jsonify({
+                "error": f"Invalid group_by/metrics: {', '.join(unknown) or 'none given'}",
+                "group_by_options": list(DIMENSIONS),
+                "metric_options": list(AGGREGATE_METRICS)
+            }), 400
+        
+        filters = parse_filters(request.args)
+        store = get_store()
+        
+        def build():
+            ids, _ = select_systems(store, filters)
+            return {
+                "group_by": group_by,
+                "metrics": metrics,
+                "filters": filters,
+                "total_systems": len(ids),
+                "groups": group_aggregate(store.group_codes, store.columns, ids, group_by, metrics),
+                "dataset_version": store.version,
+                "data_source": "polished_sdwis_active_only"
+            }
+        
+        return cached_json(store, build, key=(tuple(group_by), tuple(metrics), filter_key(filters)))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/map-data', methods=['GET'])
 def get_map_data():
     """Get processed map data from polished_data.csv"""
-    global map_data_cache
-    
     try:
         # Parameters
         force_refresh = request.args.get('refresh', 'false').lower() == 'true'
         
-        # Use cache unless forced refresh
-        if map_data_cache is not None and not force_refresh:
-            return jsonify({
-                "total": len(map_data_cache),
-                "systems": map_data_cache,
-                "cached": True,
+        # format=columnar sends parallel arrays instead of one object per marker
+        data_format = parse_format(request.args.get('format'))
+        
+        # Serve the preloaded partition unless a reload from disk is forced
+        store = reload_store() if force_refresh else get_store()
+        
+        # Viewport query: only points in view, clustered when zoomed out
+        if request.args.get('bbox') or request.args.get('zoom'):
+            return cached_json(store, lambda: get_viewport_data(store, request.args, data_format))
+        
+        def build():
+            if data_format == 'columnar':
+                fields = parse_fields(request.args.get('fields'), store.fields)
+                processed_data = columnar_systems(store, np.arange(len(store.with_coordinates)), fields)
+                total = processed_data["count"]
+            else:
+                processed_data = list(store.with_coordinates)
+                total = len(processed_data)
+            return {
+                "total": total,
+                "format": data_format,
+                "systems": processed_data,
+                "cached": not force_refresh,
                 "data_source": "polished_sdwis"
-            })
+            }
         
-        # Load processed data with coordinates only
-        processed_data = load_systems_with_coordinates()
+        return cached_json(store, build)
         
-        # Cache the results
-        map_data_cache = processed_data
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def get_viewport_data(store, args, data_format='records'):
+    """Systems inside bbox, or clusters of them with counts and worst risk below CLUSTER_MAX_ZOOM"""
+    index = store.spatial_index
+    bbox = parse_bbox(args['bbox']) if args.get('bbox') else None
+    zoom = parse_zoom(args.get('zoom', CLUSTER_MAX_ZOOM + 1))
+    fields = parse_fields(args.get('fields'), store.fields)
+    
+    ids = index.query_bbox(*bbox) if bbox else np.arange(len(index))
+    clusters = []
+    if zoom <= CLUSTER_MAX_ZOOM:
+        clusters, ids = cluster_points(ids, index.lats, index.lngs, store.coordinate_risk_codes, zoom)
+    
+    if data_format == 'columnar':
+        systems = columnar_systems(store, ids, fields)
+    else:
+        systems = project([store.with_coordinates[i] for i in ids], fields)
+    return {
+        "total": len(ids) + sum(c["count"] for c in clusters),
+        "format": data_format,
+        "bbox": bbox,
+        "zoom": zoom,
+        "clustered": zoom <= CLUSTER_MAX_ZOOM,
+        "clusters": clusters,
+        "systems": systems,
+        "data_source": "polished_sdwis"
+    }
+
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_map_tile(z, x, y):
+    """Get one map tile of systems (clustered at low zoom), with ETag revalidation"""
+    try:
+        validate_tile(z, x, y)
+        body, etag = tile_cache.get(get_store(), z, x, y)
         
-        return jsonify({
-            "total": len(processed_data),
-            "systems": processed_data,
-            "cached": False,
-            "data_source": "polished_sdwis"
-        })
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 300
+        return response.make_conditional(request)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/nearby', methods=['GET'])
+def get_nearby_systems():
+    """The k systems nearest to a point (optionally within radius_km), and the county it falls in"""
+    try:
+        lat, lng = parse_point(request.args.get('lat'), request.args.get('lng'))
+        radius_km = parse_radius(request.args.get('radius_km'))
+        k = min(max(request.args.get('k', 10, type=int), 1), MAX_NEARBY)
+        
+        store = get_store()
+        fields = parse_fields(request.args.get('fields'), store.fields)
+        
+        def build():
+            ids, distances = store.nearby_index.query(lat, lng, k=k, radius_km=radius_km)
+            systems = [
+                dict(system, distance_km=round(float(distance), 3))
+                for system, distance in zip(project([store.with_coordinates[i] for i in ids], fields), distances)
+            ]
+            county, county_distance = nearest_county(lat, lng)
+            return {
+                "lat": lat,
+                "lng": lng,
+                "radius_km": radius_km,
+                "k": k,
+                "county": {"name": county, "centroid_distance_km": round(county_distance, 3)},
+                "count": len(systems),
+                "systems": systems,
+                "data_source": "polished_sdwis"
+            }
+        
+        return cached_json(store, build)
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -156,14 +381,29 @@ def get_map_data():
 def get_unknown_locations():
     """Get systems with unknown coordinates"""
     try:
-        unknown_systems = load_unknown_location_systems()
+        # No limit returns every system, as before pagination was added
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        
+        store = get_store()
+        fields = parse_fields(request.args.get('fields'), store.fields)
+        
+        def build():
+            keys = store.columns['pwsid'][store.unknown_ids]
+            start, end, next_cursor = keyset_page(keys, cursor, limit)
+            unknown_systems = project(store.unknown_locations[start:end], fields)
+            return {
+                "total": len(store.unknown_locations),
+                "count": len(unknown_systems),
+                "systems": unknown_systems,
+                "next_cursor": next_cursor,
+                "data_source": "polished_sdwis"
+            }
         
-        return jsonify({
-            "total": len(unknown_systems),
-            "systems": unknown_systems,
-            "data_source": "polished_sdwis"
-        })
+        return cached_json(store, build)
         
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -171,41 +411,8 @@ def get_unknown_locations():
 def get_comprehensive_stats():
     """Get comprehensive statistics including inactive systems and archived data"""
     try:
-        # Load all data (including inactive systems)
-        polished_path = os.path.join(DATA_DIR, 'polished_data.csv')
-        if not os.path.exists(polished_path):
-            raise Exception("polished_data.csv not found.")
-        
-        df = pd.read_csv(polished_path)
-        df = df.replace({np.nan: None})
-        
-        # Separate active and inactive systems
-        active_systems = df[df['is_active'] == True]
-        inactive_systems = df[df['is_active'] == False]
-        
-        # Calculate comprehensive statistics
-        stats = {
-            "active_systems": {
-                "count": len(active_systems),
-                "with_current_violations": len(active_systems[active_systems['unaddressed_violations'] > 0]),
-                "with_archived_violations": len(active_systems[active_systems['archived_violations'] > 0]),
-                "population_served": int(active_systems['population'].sum())
-            },
-            "inactive_systems": {
-                "count": len(inactive_systems),
-                "total_violations": int(inactive_systems['total_violations'].sum()),
-                "archived_violations": int(inactive_systems['archived_violations'].sum())
-            },
-            "compliance_summary": {
-                "total_active_systems": len(active_systems),
-                "compliant_systems": len(active_systems[active_systems['unaddressed_violations'] == 0]),
-                "compliance_rate": round((len(active_systems[active_systems['unaddressed_violations'] == 0]) / len(active_systems)) * 100, 1) if len(active_systems) > 0 else 0,
-                "systems_with_resolved_issues": len(active_systems[active_systems['archived_violations'] > 0])
-            },
-            "data_source": "comprehensive_polished_data"
-        }
-        
-        return jsonify(stats)
+        store = get_store()
+        return cached_json(store, lambda: store.stats.comprehensive)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -230,74 +437,35 @@ def export_polished_data():
 
 
 
-def load_polished_data():
-    """Load preprocessed data from polished_data.csv, filtering for active systems only"""
+@app.route('/api/export/systems', methods=['GET'])
+def export_systems():
+    """Stream systems matching the search filters (plus active=true|false|all) as CSV or NDJSON"""
     try:
-        polished_path = os.path.join(DATA_DIR, 'polished_data.csv')
-        
-        if not os.path.exists(polished_path):
-            raise Exception("polished_data.csv not found. Please run preprocess_data.py first.")
-        
-        df = pd.read_csv(polished_path)
-        
-        # Filter for active systems only
-        df = df[df['is_active'] == True].copy()
-        
-        # Calculate adjusted violations (exclude archived/resolved violations from current counts)
-        # For compliance purposes, only count unaddressed violations as "active" violations
-        df['current_violations'] = df['unaddressed_violations']
-        df['resolved_violations'] = df['archived_violations']
-        
-        # Recalculate risk level based on current (unaddressed) violations only
-        def recalculate_risk(row):
-            health_violations = row['health_violations']
-            current_violations = row['current_violations']
-            
-            # Only count health violations that are still unaddressed
-            active_health_violations = min(health_violations, current_violations)
-            
-            if active_health_violations > 0:
-                return 'High', 'red'
-            elif current_violations > 0:
-                return 'Medium', 'orange'
-            elif row['total_violations'] > row['current_violations']:
-                # Has resolved violations but no current violations
-                return 'Good', 'green'
-            else:
-                return 'Good', 'green'
-        
-        # Apply the recalculated risk levels
-        risk_data = df.apply(lambda row: pd.Series(recalculate_risk(row)), axis=1)
-        df['risk_level'] = risk_data[0]
-        df['marker_color'] = risk_data[1]
-        
-        # Replace NaN values with None for JSON serialization
-        df = df.replace({np.nan: None})
-        
-        # Convert to list of dictionaries for JSON serialization
-        systems = df.to_dict('records')
+        export_format = parse_export_format(request.args.get('format'))
+        active = parse_active(request.args.get('active'))
+        filters = parse_filters(request.args)
+        
+        store = get_store()
+        fields = parse_fields(request.args.get('fields'), store.fields) or list(store.fields)
+        rows = select_all_systems(store, filters, active)
+        
+        # Rows are produced chunk by chunk from the store this request started with
+        body = generate_export(store.all_columns, rows, fields, export_format)
+        headers = {
+            "Content-Disposition": f"attachment; filename=georgia_water_systems.{export_format}",
+            "X-Total-Count": str(len(rows)),
+            "Vary": "Accept-Encoding"
+        }
+        if request.accept_encodings['gzip']:
+            body = gzip_stream(body)
+            headers["Content-Encoding"] = "gzip"
         
-        print(f"Loaded {len(systems)} active systems from polished_data.csv")
-        return systems
+        return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format], headers=headers)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error loading polished data: {e}")
-        raise e
-
-def load_systems_with_coordinates():
-    """Load only systems with known coordinates"""
-    all_systems = load_polished_data()
-    return [s for s in all_systems if s.get('has_coordinates') == True]
-
-def load_unknown_location_systems():
-    """Load only systems with unknown coordinates"""
-    all_systems = load_polished_data()
-    return [s for s in all_systems if s.get('has_coordinates') == False]
-
-
-
-
-
+        return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000)
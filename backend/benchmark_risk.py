@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Risk Classification Benchmark
+Times the row-wise DataFrame.apply classifiers that preprocess_data.py and the API used before
+risk.py against the vectorized engine, and reports the rows whose level changed under the unified rule
+
+Usage: python benchmark_risk.py [rows]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from risk import add_risk_columns
+
+
+def make_synthetic_systems(rows, seed=42):
+    """Build a synthetic table with a realistic mix of violation counts"""
+    rng = np.random.default_rng(seed)
+    total = rng.poisson(1.5, rows) * rng.integers(0, 2, rows)
+    unaddressed = rng.binomial(total, 0.3)
+    health = rng.binomial(total, 0.4)
+    return pd.DataFrame({
+        'health_violations': health,
+        'unaddressed_violations': unaddressed,
+        'total_violations': total,
+    })
+
+
+def preprocess_rowwise(df):
+    """preprocess_data.calculate_risk_levels before risk.py (sdwis_pipeline.py used the same rule)"""
+    def get_risk_level(row):
+        health_violations = row['health_violations']
+        unaddressed = row['unaddressed_violations']
+        total_violations = row['total_violations']
+
+        if health_violations > 0:
+            return 'High', 'red'
+        elif unaddressed > 0:
+            return 'Medium', 'orange'
+        elif total_violations > 0:
+            return 'Low', 'yellow'
+        else:
+            return 'Good', 'green'
+
+    df[['risk_level', 'marker_color']] = df.apply(lambda row: pd.Series(get_risk_level(row)), axis=1)
+    return df
+
+
+def api_rowwise(df):
+    """The API's load-time recalculation before risk.py, over current (unaddressed) violations"""
+    df['current_violations'] = df['unaddressed_violations']
+
+    def recalculate_risk(row):
+        health_violations = row['health_violations']
+        current_violations = row['current_violations']
+
+        # Only count health violations that are still unaddressed
+        active_health_violations = min(health_violations, current_violations)
+
+        if active_health_violations > 0:
+            return 'High', 'red'
+        elif current_violations > 0:
+            return 'Medium', 'orange'
+        else:
+            return 'Good', 'green'
+
+    risk_data = df.apply(lambda row: pd.Series(recalculate_risk(row)), axis=1)
+    df['risk_level'] = risk_data[0]
+    df['marker_color'] = risk_data[1]
+    return df
+
+
+def documented_change(df):
+    """
+    Rows whose level the unified rule is documented to change: health-based violations that are all
+    resolved are no longer High in preprocessing, and systems with only resolved violations are Low,
+    not Good, in the API
+    """
+    health, unaddressed, total = (df[c].to_numpy() for c in
+                                  ('health_violations', 'unaddressed_violations', 'total_violations'))
+    return {
+        'preprocess': (health > 0) & (np.minimum(health, unaddressed) == 0),
+        'api': (unaddressed == 0) & (total > 0),
+    }
+
+
+def time_it(func, df, repeat=1):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df.copy())
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report_changes(name, before, after, documented):
+    """Print the level transitions between two classifications; True if all are documented ones"""
+    changed = (before['risk_level'] != after['risk_level']).to_numpy()
+    transitions = pd.Series(before['risk_level'][changed] + ' -> ' + after['risk_level'][changed]).value_counts()
+    print(f"   {name}: {int(changed.sum()):,} rows changed level")
+    for transition, count in transitions.items():
+        print(f"      {transition}: {count:,}")
+    return bool((changed == documented).all())
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = make_synthetic_systems(rows)
+
+    print(f"🚨 Risk classification benchmark ({rows:,} rows)")
+    preprocess_time, preprocess_before = time_it(preprocess_rowwise, df)
+    api_time, api_before = time_it(api_rowwise, df)
+    vector_time, actual = time_it(add_risk_columns, df, repeat=5)
+    print(f"   Preprocess row-wise apply: {preprocess_time * 1000:10.1f} ms")
+    print(f"   API row-wise apply:        {api_time * 1000:10.1f} ms")
+    print(f"   Vectorized:                {vector_time * 1000:10.1f} ms")
+    print(f"   Speedup:                   {preprocess_time / vector_time:10.0f}x (preprocess), "
+          f"{api_time / vector_time:.0f}x (API)")
+    print(f"   Risk distribution: { {level: int(n) for level, n in actual['risk_level'].value_counts().items()} }")
+
+    print("\n🔁 Changes from the unified rule")
+    documented = documented_change(df)
+    expected = [
+        report_changes('Preprocess', preprocess_before, actual, documented['preprocess']),
+        report_changes('API', api_before, actual, documented['api']),
+    ]
+    print(f"   Only documented changes: {all(expected)}")
+
+
+if __name__ == "__main__":
+    main()
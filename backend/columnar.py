@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Columnar Map Payload
+Systems as parallel arrays instead of one dict per marker: Float32 coordinates in base64,
+small-int codes with lookup dictionaries for repeated labels, and plain arrays for the rest
+"""
+
+import base64
+
+import numpy as np
+import pandas as pd
+
+from data_store import json_values
+from risk import RISK_LEVELS
+
+FORMATS = ('records', 'columnar')
+
+# Repeated labels sent as codes; -1 stands for a missing value
+CODED_FIELDS = ('type', 'risk_level', 'marker_color', 'owner_type', 'primary_source', 'activity_status')
+
+
+def parse_format(value):
+    value = (value or 'records').strip().lower()
+    if value not in FORMATS:
+        raise ValueError(f"Unknown format '{value}' (use {' or '.join(FORMATS)})")
+    return value
+
+
+def encode_coordinates(lats, lngs):
+    """Interleaved lat, lng pairs as little-endian Float32, base64-encoded"""
+    pairs = np.column_stack([lats, lngs]).astype('<f4')
+    return base64.b64encode(pairs.tobytes()).decode('ascii')
+
+
+def _codes(store, field, rows):
+    if field == 'risk_level':
+        # Keep severity order so clients can compare codes directly
+        return store.columns['risk_code'][rows].tolist(), list(RISK_LEVELS)
+    codes, labels = pd.factorize(store.columns[field][rows], sort=True)
+    return codes.tolist(), [str(label) for label in labels]
+
+
+def columnar_systems(store, ids, fields=None):
+    """
+    Columnar block for with_coordinates[ids], limited to fields
+    Returns: {count, coordinates, columns, codes, dictionaries}
+    """
+    rows = store.coordinate_ids[np.asarray(ids, dtype=np.int64)]
+    fields = fields or store.fields
+
+    block = {"count": len(rows), "columns": {}, "codes": {}, "dictionaries": {}}
+    if 'lat' in fields or 'lng' in fields:
+        block["coordinates"] = encode_coordinates(store.columns['lat'][rows], store.columns['lng'][rows])
+
+    for field in fields:
+        if field in ('lat', 'lng'):
+            continue
+        if field in CODED_FIELDS:
+            block["codes"][field], block["dictionaries"][field] = _codes(store, field, rows)
+        else:
+            block["columns"][field] = json_values(store.columns[field][rows])
+    return block
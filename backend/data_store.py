@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Water Systems Data Store
+Process-wide, read-only view of polished_data.csv that is built once and shared by every endpoint
+"""
+
+import os
+import threading
+from collections.abc import Sequence
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from georgia_locations import GA_CITIES, GA_COUNTIES
+from risk import RISK_LEVELS, add_risk_columns
+from search_index import SearchIndex
+from snapshot import Snapshot, current_version_dir, open_snapshot, snapshot_root, write_snapshot
+from spatial_index import GridIndex, KDTree
+from stats_engine import DIMENSIONS, SystemStats, encode_groups
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+POLISHED_PATH = os.path.join(DATA_DIR, 'polished_data.csv')
+
+# Multi-process deployments: every worker attaches to the snapshot published by preprocess_data.py
+# or `snapshot.py --watch` instead of parsing the CSV, and follows its CURRENT pointer on reload
+SHARED_MODE = os.getenv('DATASET_SHARED', 'false').lower() in ('1', 'true', 'yes')
+
+# Column types of polished_data.csv as written by preprocess_data.create_polished_data
+POLISHED_DTYPES = {
+    'pwsid': str,
+    'name': str,
+    'type': str,
+    'population': 'int64',
+    'owner_type': str,
+    'primary_source': str,
+    'address': str,
+    'lat': 'float64',
+    'lng': 'float64',
+    # Geocoded point of systems whose lat/lng were spread apart for display (absent from older files)
+    'centroid_lat': 'float64',
+    'centroid_lng': 'float64',
+    'total_violations': 'int64',
+    'health_violations': 'int64',
+    'unaddressed_violations': 'int64',
+    'archived_violations': 'int64',
+    'risk_level': str,
+    'marker_color': str,
+    'has_coordinates': bool,
+    'is_active': bool,
+    'activity_status': str,
+    'has_archived_reports': bool,
+}
+
+
+def dataset_fingerprint(path=POLISHED_PATH):
+    """Return the (mtime_ns, size) pair used to detect a rewritten dataset"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def format_version(fingerprint):
+    """Short, stable version string for a dataset fingerprint"""
+    mtime_ns, size = fingerprint
+    return f"{mtime_ns // 1_000_000:x}-{size:x}"
+
+
+def read_polished_csv(path=POLISHED_PATH):
+    """Read polished_data.csv with pinned column types"""
+    if not os.path.exists(path):
+        raise FileNotFoundError("polished_data.csv not found. Please run preprocess_data.py first.")
+    return pd.read_csv(path, dtype=POLISHED_DTYPES)
+
+
+def prepare_polished(df: pd.DataFrame):
+    """Add the columns derived at load time to a freshly read polished dataset"""
+    # Calculate adjusted violations (exclude archived/resolved violations from current counts)
+    # For compliance purposes, only count unaddressed violations as "active" violations
+    df['current_violations'] = df['unaddressed_violations']
+    df['resolved_violations'] = df['archived_violations']
+
+    # Recalculate risk level based on current (unaddressed) violations only
+    return add_risk_columns(df, unaddressed_col='current_violations')
+
+
+def read_polished_data(path=POLISHED_PATH, fingerprint=None):
+    """
+    Read the polished dataset, preferring the columnar snapshot when it was written from
+    this exact CSV and falling back to parsing the CSV otherwise
+    """
+    try:
+        snapshot = open_snapshot(snapshot_root(path))
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable snapshot: {e}")
+        snapshot = None
+
+    if snapshot is not None and fingerprint is not None and snapshot.source_fingerprint == tuple(fingerprint):
+        # Snapshots also carry the store's lookup-only columns; only the served fields are read back
+        return prepare_polished(snapshot.to_frame(snapshot.metadata.get('fields')))
+    return prepare_polished(read_polished_csv(path))
+
+
+# Reverse geocoding: without county boundaries, a point belongs to the county with the nearest centroid
+COUNTY_NAMES = tuple(GA_COUNTIES)
+COUNTY_INDEX = KDTree([GA_COUNTIES[c][0] for c in COUNTY_NAMES], [GA_COUNTIES[c][1] for c in COUNTY_NAMES])
+
+
+def nearest_county(lat, lng):
+    """(GA_COUNTIES name, distance in km to its centroid) nearest to a point"""
+    ids, distances = COUNTY_INDEX.query(lat, lng, k=1)
+    return COUNTY_NAMES[ids[0]], float(distances[0])
+
+
+def split_places(addresses: pd.Series):
+    """
+    Recover city and county from addresses built by preprocess_data.create_polished_data
+    ("CITY, Name County, GA"). Returns: (city Series, county Series)
+    """
+    addresses = addresses.fillna('')
+    county = addresses.str.extract(r'(?:^|, )([^,]+) County(?:,|$)', expand=False).fillna('')
+    parts = addresses.str.split(', ')
+    first = parts.str[0].fillna('')
+    # A lone part is the state/"Georgia" fallback, and a leading county part means no city
+    has_city = (parts.str.len() > 1) & ~first.str.endswith(' County')
+    city = first.where(has_city, '')
+    return city, county
+
+
+def store_layout(frame: pd.DataFrame):
+    """
+    Order a prepared polished frame the way SystemStore keeps it: active systems first, each partition
+    in PWSID order, so the active partition is a prefix (a view, never a copy) of every column.
+    Adds the lookup-only columns (row_hash, city, county, risk_code) after the served fields.
+    Returns: (frame, served fields)
+    """
+    fields = tuple(frame.columns)
+    frame = frame.sort_values(['is_active', 'pwsid'], ascending=[False, True], kind='stable').reset_index(drop=True)
+    frame['row_hash'] = pd.util.hash_pandas_object(frame[list(fields)], index=False).to_numpy()
+    frame['city'], frame['county'] = split_places(frame['address'])
+    frame['risk_code'] = pd.Categorical(frame['risk_level'], categories=RISK_LEVELS).codes.astype(np.int8)
+    return frame, fields
+
+
+def location_partitions(columns):
+    """Positions of active systems with and without coordinates: {'coordinate_ids', 'unknown_ids'}"""
+    active = int(np.count_nonzero(columns['is_active']))
+    has_coordinates = np.asarray(columns['has_coordinates'][:active])
+    return {
+        'coordinate_ids': np.flatnonzero(has_coordinates).astype(np.int64),
+        'unknown_ids': np.flatnonzero(~has_coordinates).astype(np.int64),
+    }
+
+
+def _text(column):
+    """Column as an object array with missing text as ''"""
+    return pd.Series(np.asarray(column, dtype=object), dtype=object).fillna('').to_numpy()
+
+
+def geocoded_positions(columns, ids):
+    """
+    (lats, lngs) of rows ids at their geocoded points, or their display positions where a file
+    predates centroid_lat/centroid_lng or a system has none
+    """
+    lats = np.asarray(columns['lat'][ids], dtype=np.float64)
+    lngs = np.asarray(columns['lng'][ids], dtype=np.float64)
+    if 'centroid_lat' not in columns or 'centroid_lng' not in columns:
+        return lats, lngs
+    centroid_lats = np.asarray(columns['centroid_lat'][ids], dtype=np.float64)
+    centroid_lngs = np.asarray(columns['centroid_lng'][ids], dtype=np.float64)
+    geocoded = ~(np.isnan(centroid_lats) | np.isnan(centroid_lngs))
+    return np.where(geocoded, centroid_lats, lats), np.where(geocoded, centroid_lngs, lngs)
+
+
+# Indexes saved with a snapshot as flat arrays, each under "<name>.<array>"
+INDEX_TYPES = {'search_index': SearchIndex, 'spatial_index': GridIndex, 'nearby_index': KDTree}
+
+
+def build_indexes(columns, coordinate_ids):
+    """Lookup structures over the active columns of one dataset version"""
+    return {
+        'search_index': SearchIndex(
+            _text(columns['pwsid']),
+            _text(columns['name']),
+            _text(columns['address']),
+            _text(columns['city']),
+            _text(columns['county']),
+            place_names=list(GA_CITIES) + list(GA_COUNTIES),
+        ),
+        # Positions in the spatial indexes are positions in with_coordinates
+        'spatial_index': GridIndex(columns['lat'][coordinate_ids], columns['lng'][coordinate_ids]),
+        # Nearest-system distances are measured from the geocoded point,
+        # not the display position systems sharing a location were spread to
+        'nearby_index': KDTree(*geocoded_positions(columns, coordinate_ids)),
+        'coordinate_risk_codes': np.asarray(columns['risk_code'][coordinate_ids]),
+        'group_codes': encode_groups(columns),
+    }
+
+
+def index_arrays(indexes):
+    """Flat {name: array} form of build_indexes() output, for saving with a snapshot"""
+    arrays = {'coordinate_risk_codes': indexes['coordinate_risk_codes']}
+    for name in INDEX_TYPES:
+        arrays.update((f'{name}.{key}', array) for key, array in indexes[name].arrays().items())
+    for dimension, (labels, codes) in indexes['group_codes'].items():
+        arrays[f'group_codes.{dimension}.labels'] = labels.astype(str)
+        arrays[f'group_codes.{dimension}.codes'] = codes
+    return arrays
+
+
+def indexes_from_arrays(arrays):
+    """Indexes over the arrays index_arrays() saved, without copying them; None if they were not saved"""
+    if 'coordinate_risk_codes' not in arrays:
+        return None
+    indexes = {'coordinate_risk_codes': arrays['coordinate_risk_codes'], 'group_codes': {}}
+    for name, index_type in INDEX_TYPES.items():
+        start = len(name) + 1
+        indexes[name] = index_type.from_arrays(
+            {key[start:]: array for key, array in arrays.items() if key.startswith(name + '.')}
+        )
+    for dimension in DIMENSIONS:
+        indexes['group_codes'][dimension] = (arrays[f'group_codes.{dimension}.labels'],
+                                             arrays[f'group_codes.{dimension}.codes'])
+    return indexes
+
+
+def write_store_snapshot(frame: pd.DataFrame, root, source_fingerprint=None):
+    """
+    Publish a polished frame as a snapshot workers can serve from without decoding, copying or
+    indexing it: load-time columns included, rows in store_layout() order, partitions and indexes
+    stored alongside
+    """
+    frame, fields = store_layout(prepare_polished(frame))
+    columns = {name: frame[name].to_numpy() for name in frame.columns}
+    partitions = location_partitions(columns)
+    active_count = int(np.count_nonzero(columns['is_active']))
+    indexes = build_indexes({name: column[:active_count] for name, column in columns.items()},
+                            partitions['coordinate_ids'])
+    return write_snapshot(frame, root, source_fingerprint=source_fingerprint,
+                          arrays={**partitions, **index_arrays(indexes)}, metadata={'fields': list(fields)})
+
+
+def _freeze(array):
+    """Mark a numpy array read-only so it can be shared between requests"""
+    array.flags.writeable = False
+    return array
+
+
+def json_values(array):
+    """Python values of a column for JSON; NaN becomes None for serialization"""
+    items = array.tolist()
+    if array.dtype.kind in 'fO':
+        items = [None if item != item else item for item in items]
+    return items
+
+
+class RecordView(Sequence):
+    """
+    JSON-ready records built on access from typed columns, optionally restricted to ids.
+    Stands in for a tuple of dicts where a process should not hold one object per system.
+    """
+
+    CHUNK = 1024
+
+    def __init__(self, columns, fields, ids=None):
+        self._columns = columns
+        self._fields = fields
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids) if self._ids is not None else len(self._columns[self._fields[0]])
+
+    def _rows(self, positions):
+        rows = positions if self._ids is None else self._ids[positions]
+        values = [json_values(self._columns[field][rows]) for field in self._fields]
+        return [dict(zip(self._fields, row)) for row in zip(*values)]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._rows(np.arange(*i.indices(len(self))))
+        if not -len(self) <= i < len(self):
+            raise IndexError('record index out of range')
+        return self._rows(np.array([i % len(self)]))[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), self.CHUNK):
+            yield from self[start:start + self.CHUNK]
+
+
+class SystemStore:
+    """
+    Immutable snapshot of the polished dataset with precomputed partitions.
+    Built from columns in store_layout() order: NumPy arrays, or for shared mode the memory-mapped
+    arrays and TextColumns of a published snapshot, which are served as they are.
+    """
+
+    def __init__(self, columns, fields, source: str = POLISHED_PATH, fingerprint=(0, 0), previous=None,
+                 partitions=None, indexes=None, lazy_records=False):
+        self.source = source
+        self.fingerprint = fingerprint
+        self.version = format_version(fingerprint)
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+
+        # Fields of the served records; the other columns are for lookup only
+        self.fields = tuple(fields)
+
+        # Typed columns for every system (active and inactive); active systems come first,
+        # so their columns are slices of these
+        self.all_columns = columns
+        active_count = int(np.count_nonzero(columns['is_active']))
+        self.columns = {name: column[:active_count] for name, column in columns.items()}
+
+        partitions = partitions or location_partitions(columns)
+        self.coordinate_ids = _freeze(partitions['coordinate_ids'])
+        self.unknown_ids = _freeze(partitions['unknown_ids'])
+
+        self.systems = RecordView(self.columns, self.fields)
+        self.with_coordinates = RecordView(self.columns, self.fields, self.coordinate_ids)
+        self.unknown_locations = RecordView(self.columns, self.fields, self.unknown_ids)
+        if not lazy_records:
+            # JSON-ready records for active systems, built once
+            records = tuple(self.systems)
+            self.systems = records
+            self.with_coordinates = tuple(records[i] for i in self.coordinate_ids)
+            self.unknown_locations = tuple(records[i] for i in self.unknown_ids)
+
+        # Aggregates are carried over from the previous version where rows are unchanged
+        self.stats = SystemStats.build(
+            self.all_columns, self.all_columns['row_hash'],
+            previous=(previous.stats, previous.all_columns) if previous is not None else None,
+        )
+
+        # Lookup structures, built here or mapped from the snapshot they were saved with
+        indexes = indexes or build_indexes(self.columns, self.coordinate_ids)
+        self.search_index = indexes['search_index']
+        self.spatial_index = indexes['spatial_index']
+        self.nearby_index = indexes['nearby_index']
+        self.coordinate_risk_codes = _freeze(indexes['coordinate_risk_codes'])
+        self.group_codes = indexes['group_codes']
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, **kwargs):
+        """Store over a prepared polished frame, holding its columns as private NumPy arrays"""
+        frame, fields = store_layout(frame)
+        columns = {name: _freeze(frame[name].to_numpy()) for name in frame.columns}
+        return cls(columns, fields, **kwargs)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, **kwargs):
+        """Store serving a published snapshot's mapped columns, partitions and indexes directly"""
+        columns = {name: snapshot.shared_column(name) for name in snapshot.manifest['columns']}
+        return cls(columns, snapshot.metadata['fields'], partitions=snapshot.arrays,
+                   indexes=indexes_from_arrays(snapshot.arrays), **kwargs)
+
+    def __len__(self):
+        return len(self.systems)
+
+    def describe(self):
+        """Version metadata exposed through the API"""
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "source": os.path.basename(self.source),
+            "total_systems": len(self.all_columns['pwsid']),
+            "active_systems": len(self.systems)
+        }
+
+
+def load_shared_store(root, previous=None):
+    """
+    Attach to the current published snapshot. The version comes from the CSV the snapshot was
+    written from, so every worker reports the same version (and ETags and cursors stay valid across them)
+    """
+    directory = current_version_dir(root)
+    if directory is None:
+        raise FileNotFoundError("No published dataset snapshot. Please run preprocess_data.py or snapshot.py first.")
+
+    snapshot = Snapshot(directory)
+    if 'fields' not in snapshot.metadata:
+        raise ValueError(f"Snapshot {directory} predates shared serving; republish it with snapshot.py")
+    store = SystemStore.from_snapshot(snapshot, source=directory, fingerprint=snapshot.source_fingerprint or (0, 0),
+                                      previous=previous, lazy_records=True)
+    print(f"Attached to snapshot {os.path.basename(directory)} with {len(store)} active systems "
+          f"(version {store.version}, {store.stats.changed_rows} rows re-aggregated)")
+    return store
+
+
+def load_store(path=POLISHED_PATH, previous=None):
+    """Parse the polished dataset into a new SystemStore, reusing aggregates from previous"""
+    if SHARED_MODE:
+        return load_shared_store(snapshot_root(path), previous=previous)
+
+    # Fingerprint before reading: if the file changes mid-read the next poll sees a newer version
+    fingerprint = dataset_fingerprint(path) if os.path.exists(path) else (0, 0)
+    store = SystemStore.from_frame(read_polished_data(path, fingerprint), source=path, fingerprint=fingerprint,
+                                   previous=previous)
+    print(f"Loaded {len(store)} active systems from {os.path.basename(path)} (version {store.version}, "
+          f"{store.stats.changed_rows} rows re-aggregated)")
+    return store
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def peek_store():
+    """Return the current store without triggering a load (None if nothing is loaded yet)"""
+    return _store
+
+
+def get_store():
+    """Return the process-wide store, building it on first use"""
+    global _store
+
+    store = _store
+    if store is not None:
+        return store
+
+    with _store_lock:
+        if _store is None:
+            _store = load_store()
+        return _store
+
+
+def _swap_store(store):
+    """Publish a fully built store; requests holding the old one keep using it"""
+    global _store
+
+    with _store_lock:
+        _store = store
+    return store
+
+
+def reload_store():
+    """Rebuild the store from disk and swap it in for subsequent requests"""
+    return _swap_store(load_store(previous=_store))
+
+
+class DatasetReloader:
+    """
+    Watches polished_data.csv and swaps in a freshly built store when it changes.
+    In shared mode it follows the snapshot's CURRENT pointer instead, so workers switch together.
+    """
+
+    def __init__(self, path=POLISHED_PATH, interval=2.0):
+        self.path = path
+        self.interval = interval
+        self._pending = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """Poll once; returns True if a new store was swapped in"""
+        if SHARED_MODE:
+            return self._check_snapshot()
+
+        try:
+            fingerprint = dataset_fingerprint(self.path)
+        except OSError:
+            return False
+
+        current = _store
+        if current is not None and current.fingerprint == fingerprint:
+            self._pending = None
+            return False
+
+        # Only load once the file has stopped changing between two polls
+        if fingerprint != self._pending:
+            self._pending = fingerprint
+            return False
+        self._pending = None
+        return self._load(current)
+
+    def _check_snapshot(self):
+        # The pointer only ever names a complete version, so there is nothing to wait for
+        current = _store
+        directory = current_version_dir(snapshot_root(self.path))
+        if directory is None or (current is not None and current.source == directory):
+            return False
+        return self._load(current)
+
+    def _load(self, current):
+        try:
+            store = load_store(self.path, previous=current)
+        except Exception as e:
+            print(f"Error reloading polished data, keeping version "
+                  f"{current.version if current else None}: {e}")
+            return False
+
+        _swap_store(store)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """Start polling in a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='dataset-reloader', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
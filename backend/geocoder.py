@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Async Geocoder
+Geocodes many addresses concurrently over one pooled HTTP session, limited by a token bucket,
+retried with exponential backoff and remembered in an on-disk SQLite cache with expiry
+"""
+
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Google's endpoint by default; point GEOCODE_BASE_URL at any server speaking the same JSON (e.g. a local stub)
+GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# Cached answers are trusted this long; "not found" answers are retried sooner
+CACHE_TTL = 90 * 24 * 3600
+MISS_TTL = 7 * 24 * 3600
+
+# Statuses worth asking again, and HTTP codes that mean the same
+RETRY_STATUSES = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+RETRY_HTTP_CODES = {429, 500, 502, 503, 504}
+
+
+def normalize_address(address):
+    """Cache key for an address: upper case, punctuation other than commas removed, single spaces"""
+    cleaned = ' '.join(re.sub(r'[^\w\s,]', ' ', str(address).upper()).split())
+    return re.sub(r'\s*,\s*', ', ', cleaned).strip(', ')
+
+
+class GeocodeCache:
+    """Geocoding answers in SQLite, keyed by normalized address; a miss is stored as NULL coordinates"""
+
+    def __init__(self, path, ttl=CACHE_TTL, miss_ttl=MISS_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps the per-answer commits cheap and lets readers in other processes continue
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "address TEXT PRIMARY KEY, lat REAL, lng REAL, fetched_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, address):
+        """(lat, lng) or (None, None) for a known miss; None if the address is unknown or expired"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT lat, lng, fetched_at FROM geocode WHERE address = ?", (address,)
+            ).fetchone()
+        if row is None:
+            return None
+        lat, lng, fetched_at = row
+        ttl = self.ttl if lat is not None else self.miss_ttl
+        if time.time() - fetched_at > ttl:
+            return None
+        return lat, lng
+
+    def put(self, address, lat, lng):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode (address, lat, lng, fetched_at) VALUES (?, ?, ?, ?)",
+                (address, lat, lng, time.time())
+            )
+            self._db.commit()
+
+    def purge_expired(self):
+        """Drop expired rows; returns how many were removed"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM geocode WHERE (lat IS NOT NULL AND fetched_at < ?) OR (lat IS NULL AND fetched_at < ?)",
+                (now - self.ttl, now - self.miss_ttl)
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self._db.close()
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class GeocodeError(Exception):
+    """Request failed in a way that may succeed if retried"""
+
+
+class AsyncGeocoder:
+    """Concurrent geocoding client; geocode_all() is the blocking entry point for scripts"""
+
+    def __init__(self, api_key, cache_path, base_url=None, concurrency=8, rate=20.0,
+                 retries=3, backoff=0.5, timeout=10.0, ttl=CACHE_TTL):
+        self.api_key = api_key
+        self.base_url = base_url or os.environ.get('GEOCODE_BASE_URL', GOOGLE_GEOCODE_URL)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = GeocodeCache(cache_path, ttl=ttl)
+
+        # One keep-alive connection per concurrent request, reused for every address
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='geocode')
+        self.stats = {"cached": 0, "requested": 0, "retried": 0, "failed": 0}
+
+    def _fetch(self, address):
+        """One blocking request; returns (lat, lng), (None, None) if not found, or raises GeocodeError"""
+        try:
+            response = self.session.get(
+                self.base_url, params={'address': address, 'key': self.api_key}, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise GeocodeError(str(e))
+        if response.status_code in RETRY_HTTP_CODES:
+            raise GeocodeError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+
+        data = response.json()
+        status = data.get('status')
+        if status == 'OK' and data.get('results'):
+            location = data['results'][0]['geometry']['location']
+            return location['lat'], location['lng']
+        if status == 'ZERO_RESULTS':
+            return None, None
+        if status in RETRY_STATUSES:
+            raise GeocodeError(status)
+        # REQUEST_DENIED / INVALID_REQUEST will not improve by asking again
+        raise ValueError(f"{status}: {data.get('error_message', '')}".strip())
+
+    async def _geocode(self, key, semaphore, bucket):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                await bucket.acquire()
+                try:
+                    lat, lng = await loop.run_in_executor(self._executor, self._fetch, key)
+                except GeocodeError as e:
+                    if attempt == self.retries:
+                        print(f"Geocoding error for {key}: {e}")
+                        break
+                    self.stats["retried"] += 1
+                    await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+                    continue
+                except Exception as e:
+                    print(f"Geocoding error for {key}: {e}")
+                    break
+                self.stats["requested"] += 1
+                self.cache.put(key, lat, lng)
+                return lat, lng
+        # Failures are not cached, so the next run asks again
+        self.stats["failed"] += 1
+        return None, None
+
+    async def geocode_many(self, addresses):
+        """{address: (lat, lng)} for every address, (None, None) where it could not be found"""
+        keys = {address: normalize_address(address) for address in addresses}
+        results, pending = {}, set()
+        for key in set(keys.values()):
+            cached = self.cache.get(key)
+            if cached is None:
+                pending.add(key)
+            else:
+                self.stats["cached"] += 1
+                results[key] = cached
+
+        if pending:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            bucket = TokenBucket(self.rate)
+            ordered = sorted(pending)
+            answers = await asyncio.gather(*(self._geocode(key, semaphore, bucket) for key in ordered))
+            results.update(zip(ordered, answers))
+        return {address: results[key] for address, key in keys.items()}
+
+    def geocode_all(self, addresses):
+        """Blocking geocode_many()"""
+        return asyncio.run(self.geocode_many(addresses))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+        self.cache.close()
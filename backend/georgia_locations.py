@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 """
 Georgia Locations Database
-Contains coordinate data for Georgia cities, towns, counties, and unincorporated communities
+Contains coordinate data for Georgia cities, towns, counties, and unincorporated communities,
+and an offline geocoder that matches messy place names and ZIP codes against them
 """
 
+import csv
+import difflib
+import math
+import os
+import re
+from collections import namedtuple
+
+import pandas as pd
+
 # Dictionary of Georgia cities, towns, and unincorporated communities with coordinates
 # Format: 'NAME': (latitude, longitude)
 # Coordinates are approximate centers of the locations
@@ -583,4 +593,187 @@ def get_coordinates(city=None, county=None, fallback_city=None):
             return lat, lng, True
     
     # No coordinates found
-    return None, None, False
\ No newline at end of file
+    return None, None, False
+
+
+# Offline geocoding: normalized names, ZIP centroids and fuzzy place matching
+
+# ZIP centroid table (columns zip, lat, lng), e.g. from the Census ZCTA gazetteer. None is shipped:
+# without it ZIP codes served are never used to place a system
+ZIP_CENTROIDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ga_zip_centroids.csv')
+
+# Fuzzy matches below this similarity, on names shorter than FUZZY_MIN_LENGTH, or further than
+# FUZZY_MAX_KM from the system's county are not trusted (they are usually a different real town)
+FUZZY_CUTOFF = 0.9
+FUZZY_MIN_LENGTH = 6
+FUZZY_MAX_KM = 60
+
+# How much each kind of match is trusted, best first
+CONFIDENCE = {
+    'city': 1.0,
+    'city_fuzzy': 0.9,
+    'zip': 0.8,
+    'county': 0.6,
+    'fallback_city': 0.5,
+    'fallback_fuzzy': 0.45,
+}
+
+ABBREVIATIONS = {
+    'ST': 'SAINT', 'STE': 'SAINTE', 'MT': 'MOUNT', 'FT': 'FORT', 'PT': 'POINT',
+    'HTS': 'HEIGHTS', 'SPGS': 'SPRINGS', 'SPG': 'SPRING', 'JCT': 'JUNCTION', 'LK': 'LAKE',
+}
+DIRECTIONS = {'N': 'NORTH', 'S': 'SOUTH', 'E': 'EAST', 'W': 'WEST'}
+
+PlaceMatch = namedtuple('PlaceMatch', ['lat', 'lng', 'source', 'confidence', 'matched'])
+NO_MATCH = PlaceMatch(None, None, None, 0.0, None)
+
+def normalize_place_name(name, county=False):
+    """
+    Canonical form of a place name: upper case, no punctuation, parentheticals or ZIP codes,
+    no "CITY OF" prefix or trailing state name (including ones cut short by the 15-character
+    city field, like "GEORGI" or "GE"), and common abbreviations spelled out.
+    county=True also drops a "COUNTY" suffix.
+    """
+    if not isinstance(name, str):
+        return ''
+    truncated = len(name.rstrip()) >= 15
+    name = re.sub(r'\(.*?\)', ' ', name.upper())
+    name = re.sub(r"[.']", '', name)
+    tokens = [t for t in re.sub(r'[^A-Z0-9]+', ' ', name).split() if not t.isdigit()]
+
+    while len(tokens) > 2 and tokens[1] == 'OF' and tokens[0] in ('CITY', 'TOWN', 'VILLAGE'):
+        tokens = tokens[2:]
+    while len(tokens) > 1 and (tokens[-1] in ('GA', 'GEORGIA') or (truncated and 'GEORGIA'.startswith(tokens[-1]))):
+        tokens = tokens[:-1]
+    if county and len(tokens) > 1 and tokens[-1] in ('COUNTY', 'CO', 'CNTY'):
+        tokens = tokens[:-1]
+    if len(tokens) > 1 and tokens[0] in DIRECTIONS:
+        tokens[0] = DIRECTIONS[tokens[0]]
+    return ' '.join(ABBREVIATIONS.get(t, t) for t in tokens)
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+def normalize_zip(value):
+    """Five-digit ZIP code, or '' if value does not start with one"""
+    match = re.match(r'\s*(\d{5})', str(value)) if value is not None else None
+    return match.group(1) if match else ''
+
+def load_zip_centroids(path=ZIP_CENTROIDS_FILE):
+    """{zip: (lat, lng)} from a CSV with zip, lat and lng columns; empty if the file does not exist"""
+    centroids = {}
+    if not os.path.exists(path):
+        return centroids
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            zip_code = normalize_zip(row.get('zip'))
+            try:
+                centroids[zip_code] = (float(row['lat']), float(row['lng']))
+            except (TypeError, ValueError, KeyError):
+                continue
+    centroids.pop('', None)
+    return centroids
+
+class OfflineGeocoder:
+    """
+    Resolves systems to coordinates without network calls: exact and fuzzy city matches on normalized
+    names, ZIP centroids, then county centroids, each with a confidence score
+    """
+
+    def __init__(self, zip_centroids=None):
+        self.cities = {normalize_place_name(name): name for name in GA_CITIES}
+        # Same names without spaces, so "LA GRANGE" finds LAGRANGE
+        self.compact_cities = {key.replace(' ', ''): name for key, name in self.cities.items()}
+        self.counties = {normalize_place_name(name, county=True): name for name in GA_COUNTIES}
+        self.zip_centroids = dict(load_zip_centroids() if zip_centroids is None else zip_centroids)
+        self._city_names = list(self.cities)
+        self._city_matches = {}
+
+    def match_city(self, name):
+        """(GA_CITIES key, similarity) for a city name, or (None, 0.0); exact matches have similarity 1.0"""
+        key = normalize_place_name(name)
+        if not key:
+            return None, 0.0
+        if key not in self._city_matches:
+            if key in self.cities:
+                self._city_matches[key] = (self.cities[key], 1.0)
+            elif key.replace(' ', '') in self.compact_cities:
+                self._city_matches[key] = (self.compact_cities[key.replace(' ', '')], 1.0)
+            elif len(key) < FUZZY_MIN_LENGTH:
+                self._city_matches[key] = (None, 0.0)
+            else:
+                close = difflib.get_close_matches(key, self._city_names, n=1, cutoff=FUZZY_CUTOFF)
+                if close:
+                    ratio = difflib.SequenceMatcher(None, key, close[0]).ratio()
+                    self._city_matches[key] = (self.cities[close[0]], ratio)
+                else:
+                    self._city_matches[key] = (None, 0.0)
+        return self._city_matches[key]
+
+    def match_county(self, name):
+        """GA_COUNTIES key for a county name, or None"""
+        return self.counties.get(normalize_place_name(name, county=True))
+
+    def _city(self, name, exact_source, fuzzy_source, near=None):
+        matched, similarity = self.match_city(name)
+        if matched is None:
+            return None
+        lat, lng = GA_CITIES[matched]
+        if similarity == 1.0:
+            return PlaceMatch(lat, lng, exact_source, CONFIDENCE[exact_source], matched)
+        if near is not None and distance_km(lat, lng, *near) > FUZZY_MAX_KM:
+            return None
+        return PlaceMatch(lat, lng, fuzzy_source, round(CONFIDENCE[fuzzy_source] * similarity, 3), matched)
+
+    def geocode(self, city=None, county=None, fallback_city=None, zip_code=None):
+        """
+        Best match in order of precision: city served, ZIP served, county, then the system's own city.
+        A fuzzy city served or a ZIP centroid only counts if it lies within FUZZY_MAX_KM of the county.
+        Returns: PlaceMatch(lat, lng, source, confidence, matched) with source None if nothing matched
+        """
+        county_match = self.match_county(county)
+        near = GA_COUNTIES[county_match] if county_match is not None else None
+
+        match = self._city(city, 'city', 'city_fuzzy', near)
+        if match is not None:
+            return match
+
+        zip_code = normalize_zip(zip_code)
+        if zip_code in self.zip_centroids:
+            lat, lng = self.zip_centroids[zip_code]
+            if near is None or distance_km(lat, lng, *near) <= FUZZY_MAX_KM:
+                return PlaceMatch(lat, lng, 'zip', CONFIDENCE['zip'], zip_code)
+
+        if county_match is not None:
+            lat, lng = near
+            return PlaceMatch(lat, lng, 'county', CONFIDENCE['county'], county_match)
+
+        match = self._city(fallback_city, 'fallback_city', 'fallback_fuzzy')
+        return match if match is not None else NO_MATCH
+
+    def geocode_columns(self, city=None, county=None, fallback_city=None, zip_code=None):
+        """
+        geocode() over whole columns: each distinct (city, county, fallback city, ZIP) combination
+        is resolved once and the results are joined back to the rows by position
+        Returns: DataFrame of lat, lng, has_coordinates, source ('none' if unmatched) and confidence
+        """
+        columns = (('city', city), ('county', county), ('fallback_city', fallback_city), ('zip_code', zip_code))
+        count = max(len(values) for _, values in columns if values is not None)
+        keys = pd.DataFrame({
+            name: [''] * count if values is None else pd.Series(values).fillna('').astype(str).to_numpy()
+            for name, values in columns
+        })
+        # Group numbers follow first appearance, which is also the order drop_duplicates keeps
+        codes = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+        unique = keys.drop_duplicates()
+
+        matches = pd.DataFrame(
+            [self.geocode(*row) for row in unique.itertuples(index=False, name=None)], columns=PlaceMatch._fields
+        )
+        result = matches.iloc[codes].reset_index(drop=True)
+        result['has_coordinates'] = result['source'].notna()
+        result['source'] = result['source'].fillna('none')
+        return result[['lat', 'lng', 'has_coordinates', 'source', 'confidence']]
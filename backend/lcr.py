@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Lead and Copper Results
+Per-system summary of the Lead and Copper Rule 90th percentile results (latest value, action level
+exceedances and trend), computed with grouped NumPy operations and stored as a columnar snapshot
+sorted by PWSID so one system is a binary-searchable row
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from snapshot import Snapshot, current_version_dir, write_snapshot
+
+LCR_DIR = os.path.join(os.path.dirname(__file__), 'data', 'lcr')
+
+# Raw columns the summary needs
+LCR_COLUMNS = ['PWSID', 'CONTAMINANT_CODE', 'SAMPLING_END_DATE', 'RESULT_SIGN_CODE', 'SAMPLE_MEASURE', 'UNIT_OF_MEASURE']
+
+# 90th percentile contaminant codes and the prefix of their summary columns
+CONTAMINANTS = {'PB90': 'pb90', 'CU90': 'cu90'}
+
+# Action levels in mg/L
+ACTION_LEVELS = {'PB90': 0.015, 'CU90': 1.3}
+
+# Multiplier to mg/L for each spelling of a unit; results in other units are dropped
+UNIT_FACTORS = {
+    'mg/l': 1.0,
+    'ppm': 1.0,
+    'ug/l': 0.001,
+    'µg/l': 0.001,
+    'ppb': 0.001,
+    'ng/l': 1e-6,
+    'ppt': 1e-6,
+}
+
+# Results labelled mg/L above this are µg/L values with the wrong unit (copper 90th percentiles
+# of 100-6500 "mg/L" appear in the raw file). Lead is never rescaled: a high lead result is
+# better shown as reported than silently lowered by a factor of 1000.
+PLAUSIBLE_MAX_MG_L = {'CU90': 50.0}
+
+# RESULT_SIGN_CODE for a result below the detection limit, which counts as zero
+BELOW_DETECTION = 'L'
+
+# The trend is fitted over this many of the most recent monitoring periods; smaller changes
+# (in mg/L across those periods) count as stable
+TREND_PERIODS = 4
+TREND_TOLERANCE = {'PB90': 0.002, 'CU90': 0.1}
+
+# contaminant= values the API accepts, and the trend labels it can filter on
+CONTAMINANT_NAMES = {'lead': 'PB90', 'pb90': 'PB90', 'copper': 'CU90', 'cu90': 'CU90'}
+TRENDS = ('rising', 'falling', 'stable', 'insufficient')
+
+
+def parse_contaminant(value):
+    """Contaminant code for a contaminant= parameter, or None for both"""
+    if not value:
+        return None
+    code = CONTAMINANT_NAMES.get(value.strip().lower())
+    if code is None:
+        raise ValueError("contaminant must be lead or copper")
+    return code
+
+
+def parse_trend(value):
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value not in TRENDS:
+        raise ValueError(f"trend must be one of: {', '.join(TRENDS)}")
+    return value
+
+
+def normalize_samples(samples):
+    """
+    90th percentile results in mg/L with one row per system, contaminant and monitoring period
+    (the highest if a period was reported more than once).
+    Returns: (frame with pwsid, code, date, value, below_detection, unit_corrected; rows dropped)
+    """
+    codes = samples['CONTAMINANT_CODE'].str.strip().str.upper()
+    units = samples['UNIT_OF_MEASURE'].fillna('mg/L').str.strip().str.lower().str.replace(' ', '', regex=False)
+    below = samples['RESULT_SIGN_CODE'].fillna('').str.strip().str.upper() == BELOW_DETECTION
+
+    values = pd.to_numeric(samples['SAMPLE_MEASURE'], errors='coerce').to_numpy(dtype=float)
+    values = values * units.map(UNIT_FACTORS).to_numpy(dtype=float)
+    limits = codes.map(PLAUSIBLE_MAX_MG_L).to_numpy(dtype=float)
+    corrected = values > limits
+    values = np.where(corrected, values / 1000.0, values)
+    values = np.where(below.to_numpy(), 0.0, values)
+
+    frame = pd.DataFrame({
+        'pwsid': samples['PWSID'].str.strip().str.upper(),
+        'code': codes,
+        'date': pd.to_datetime(samples['SAMPLING_END_DATE'], format='%m/%d/%Y', errors='coerce'),
+        'value': values,
+        'below_detection': below.to_numpy(),
+        'unit_corrected': corrected,
+    })
+    frame = frame[frame['code'].isin(list(CONTAMINANTS)) & frame['value'].notna() & frame['date'].notna()]
+    dropped = len(samples) - len(frame)
+
+    frame = frame.groupby(['pwsid', 'code', 'date'], sort=False).agg(
+        value=('value', 'max'), below_detection=('below_detection', 'all'), unit_corrected=('unit_corrected', 'any')
+    ).reset_index()
+    return frame, dropped
+
+
+def _trend_labels(slopes, spans, counts, tolerance):
+    """rising / falling / stable from fitted slopes (mg/L per year), or insufficient below two periods"""
+    change = slopes * spans
+    labels = np.where(change > tolerance, 'rising', np.where(change < -tolerance, 'falling', 'stable'))
+    return np.where(counts < 2, 'insufficient', labels).astype(object)
+
+
+def summarize_contaminant(results, code):
+    """Per-system latest value, period count, action level exceedances, maximum and trend for one contaminant"""
+    prefix = CONTAMINANTS[code]
+    results = results[results['code'] == code]
+    pwsids, groups = np.unique(results['pwsid'].to_numpy(dtype=object), return_inverse=True)
+    days = results['date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    values = results['value'].to_numpy(dtype=float)
+
+    # Oldest first within each system, so every group is a contiguous run ending at its latest period
+    order = np.lexsort((days, groups))
+    groups, days, values = groups[order], days[order], values[order]
+    counts = np.bincount(groups, minlength=len(pwsids))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    ends = starts + counts - 1
+
+    exceedances = np.bincount(groups, weights=values > ACTION_LEVELS[code], minlength=len(pwsids)).astype(int)
+    maxima = np.maximum.reduceat(values, starts) if len(values) else np.empty(0)
+
+    # Least-squares slope over each system's most recent periods, in mg/L per year
+    rank = np.arange(len(groups)) - starts[groups]
+    recent = rank >= counts[groups] - TREND_PERIODS
+    g, t, y = groups[recent], days[recent] / 365.25, values[recent]
+    n = np.bincount(g, minlength=len(pwsids)).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = np.bincount(g, weights=t, minlength=len(pwsids)) / n
+        y_mean = np.bincount(g, weights=y, minlength=len(pwsids)) / n
+        dt = t - t_mean[g]
+        slopes = (np.bincount(g, weights=dt * (y - y_mean[g]), minlength=len(pwsids))
+                  / np.bincount(g, weights=dt * dt, minlength=len(pwsids)))
+    slopes = np.nan_to_num(slopes)
+    spans = np.zeros(len(pwsids))
+    if len(t):
+        spans = t[np.searchsorted(g, np.arange(len(pwsids)), side='right') - 1] - t[np.searchsorted(g, np.arange(len(pwsids)))]
+
+    latest_dates = days[ends].astype('datetime64[D]').astype(str) if len(values) else np.empty(0, dtype=str)
+    return pd.DataFrame({
+        'pwsid': pwsids.astype(str),
+        f'{prefix}_latest': values[ends] if len(values) else np.empty(0),
+        f'{prefix}_latest_date': latest_dates.astype(object),
+        f'{prefix}_periods': counts,
+        f'{prefix}_exceedances': exceedances,
+        f'{prefix}_max': maxima,
+        f'{prefix}_trend': _trend_labels(slopes, spans, counts, TREND_TOLERANCE[code]),
+        f'{prefix}_slope_per_year': np.round(slopes, 6),
+    })
+
+
+def build_lcr_summary(samples):
+    """
+    One row per system with LCR results: latest value and date, periods, exceedances, maximum and trend
+    of each contaminant, whether the latest result is above its action level, and how many results
+    were below detection or had their unit corrected
+    """
+    print("\n🧪 Summarizing lead and copper results...")
+    results, dropped = normalize_samples(samples)
+
+    summary = None
+    for code in CONTAMINANTS:
+        part = summarize_contaminant(results, code)
+        summary = part if summary is None else summary.merge(part, on='pwsid', how='outer')
+
+    for code, prefix in CONTAMINANTS.items():
+        summary[[f'{prefix}_periods', f'{prefix}_exceedances']] = (
+            summary[[f'{prefix}_periods', f'{prefix}_exceedances']].fillna(0).astype(int)
+        )
+        summary[f'{prefix}_trend'] = summary[f'{prefix}_trend'].fillna('no data')
+    summary['lead_action_level_exceeded'] = (summary['pb90_latest'] > ACTION_LEVELS['PB90']).astype(bool)
+    summary['copper_action_level_exceeded'] = (summary['cu90_latest'] > ACTION_LEVELS['CU90']).astype(bool)
+
+    flags = results.groupby('pwsid').agg(
+        below_detection_results=('below_detection', 'sum'), unit_corrected_results=('unit_corrected', 'sum')
+    ).reset_index()
+    summary = summary.merge(flags, on='pwsid', how='left')
+    summary = summary.sort_values('pwsid', kind='stable').reset_index(drop=True)
+
+    print(f"   ✅ {len(summary)} systems from {len(results)} monitoring periods ({dropped} unusable rows dropped, "
+          f"{int(summary['unit_corrected_results'].sum())} µg/L results relabelled)")
+    print(f"   ⚠️  Latest result above the action level: {int(summary['lead_action_level_exceeded'].sum())} lead, "
+          f"{int(summary['copper_action_level_exceeded'].sum())} copper")
+    return summary
+
+
+def write_lcr(summary, root=LCR_DIR):
+    """Publish a new LCR summary version from build_lcr_summary()'s frame"""
+    return write_snapshot(summary.sort_values('pwsid', kind='stable').reset_index(drop=True), root)
+
+
+def _plain(value):
+    """JSON-ready cell: NumPy scalars unwrapped, missing values as None"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+class LeadCopper:
+    """Read-only view of one LCR summary version"""
+
+    def __init__(self, directory):
+        self.version = os.path.basename(directory)
+        self._snapshot = Snapshot(directory)
+        self._pwsids = self._snapshot.shared_column('pwsid')
+        self.fields = [name for name in self._snapshot.manifest['columns'] if name != 'pwsid']
+
+    def find(self, pwsid):
+        """Row of one system, or None if it has no LCR results"""
+        key = pwsid.strip().upper()
+        i = int(np.searchsorted(self._pwsids, key, side='left'))
+        if i == len(self._pwsids) or self._pwsids[i] != key:
+            return None
+        return i
+
+    def records(self, rows):
+        """JSON-ready summaries for rows, decoding each field once for all of them"""
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = [(name, self._snapshot.column(name, rows)) for name in ('pwsid', *self.fields)]
+        return [{name: _plain(values[i]) for name, values in columns} for i in range(len(rows))]
+
+    def system(self, pwsid):
+        """Summary for one system, or None if it has no LCR results"""
+        i = self.find(pwsid)
+        return None if i is None else self.records([i])[0]
+
+    def rank(self, contaminant=None, exceeding=False, trend=None):
+        """Rows of systems with results for contaminant (PB90/CU90, None for either), optionally only those
+        whose latest result exceeds the action level or whose trend matches, highest latest result first"""
+        codes = [contaminant] if contaminant else list(CONTAMINANTS)
+        keep = np.zeros(len(self._pwsids), dtype=bool)
+        for code in codes:
+            prefix = CONTAMINANTS[code]
+            mask = self._snapshot.column(f'{prefix}_periods') > 0
+            if exceeding:
+                mask &= self._snapshot.column(f'{prefix}_latest') > ACTION_LEVELS[code]
+            if trend:
+                mask &= self._snapshot.shared_column(f'{prefix}_trend').equals(trend)
+            keep |= mask
+
+        rows = np.flatnonzero(keep)
+        # Rank by the latest result as a multiple of its action level, so lead and copper compare fairly
+        ratio = np.fmax.reduce([np.nan_to_num(self._snapshot.column(f'{CONTAMINANTS[code]}_latest')[rows], nan=-1.0)
+                                / ACTION_LEVELS[code] for code in codes])
+        return rows[np.argsort(-ratio, kind='stable')]
+
+
+_lcr = None
+_lcr_lock = threading.Lock()
+
+
+def get_lcr(root=LCR_DIR):
+    """Current LCR summary version, reattached whenever preprocess_data.py publishes a new one"""
+    global _lcr
+
+    directory = current_version_dir(root)
+    if directory is None:
+        raise FileNotFoundError("No lead and copper results found. Please run preprocess_data.py first.")
+
+    with _lcr_lock:
+        if _lcr is None or _lcr.version != os.path.basename(directory):
+            _lcr = LeadCopper(directory)
+        return _lcr
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Pagination and Field Projection
+Opaque cursors and column selection shared by the list endpoints
+"""
+
+import base64
+import json
+
+import numpy as np
+
+
+class PaginationError(ValueError):
+    """Raised for malformed or stale cursors and unknown fields (reported as HTTP 400)"""
+
+
+def encode_cursor(state):
+    """Encode cursor state as an opaque URL-safe token"""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a token produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise PaginationError("Invalid cursor")
+    if not isinstance(state, dict):
+        raise PaginationError("Invalid cursor")
+    return state
+
+
+def keyset_page(keys, cursor, limit):
+    """
+    Page through rows sorted by a unique key (PWSID). The cursor remembers the last key
+    served, so pages stay stable even if the dataset is reloaded between requests.
+    Returns: (start, end, next_cursor)
+    """
+    start = 0
+    if cursor:
+        after = decode_cursor(cursor).get('after')
+        if not isinstance(after, str):
+            raise PaginationError("Invalid cursor")
+        start = int(np.searchsorted(keys, after, side='right'))
+
+    end = len(keys) if limit is None else min(start + limit, len(keys))
+    next_cursor = encode_cursor({'after': str(keys[end - 1])}) if end < len(keys) and end > start else None
+    return start, end, next_cursor
+
+
+def offset_page(total, cursor, limit, version, query_key):
+    """
+    Page through a ranked result list. Rank order is only meaningful for one dataset
+    version and query, so the cursor is rejected if either has changed.
+    Returns: (start, end, next_cursor)
+    """
+    start = 0
+    if cursor:
+        state = decode_cursor(cursor)
+        if state.get('v') != version or state.get('q') != query_key:
+            raise PaginationError("Cursor no longer matches this query or dataset version; start from the first page")
+        start = state.get('o')
+        if not isinstance(start, int) or start < 0:
+            raise PaginationError("Invalid cursor")
+
+    end = total if limit is None else min(start + limit, total)
+    next_cursor = encode_cursor({'v': version, 'q': query_key, 'o': end}) if end < total else None
+    return start, end, next_cursor
+
+
+def parse_fields(value, allowed):
+    """Parse a comma-separated fields= parameter; None means every field"""
+    if not value:
+        return None
+
+    fields = list(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise PaginationError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(allowed)}")
+    return fields
+
+
+def project(records, fields):
+    """Keep only the requested fields of each record"""
+    if fields is None:
+        return list(records)
+    return [{f: record[f] for f in fields} for record in records]
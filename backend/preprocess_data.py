@@ -5,32 +5,53 @@ Processes raw SDWIS CSV files into a single polished_data.csv for the dashboard
 """
 
 import pandas as pd
+import csv
+import inspect
+import io
+import json
 import os
 import sys
 from datetime import datetime
 
 # Import the Georgia locations module
 try:
-    from georgia_locations import get_coordinates
+    from georgia_locations import ZIP_CENTROIDS_FILE, OfflineGeocoder
 except ImportError:
     print("❌ Georgia locations module not found. Make sure georgia_locations.py is in the same directory.")
     sys.exit(1)
 
-def load_csv_safe(filepath):
-    """Safely load CSV file with error handling"""
-    try:
-        if not os.path.exists(filepath):
-            print(f"❌ File not found: {filepath}")
-            return None
-        
-        df = pd.read_csv(filepath, low_memory=False)
-        print(f"✅ Loaded {len(df)} records from {os.path.basename(filepath)}")
-        return df
-    except Exception as e:
-        print(f"❌ Error loading {filepath}: {e}")
-        return None
+from lcr import LCR_COLUMNS, build_lcr_summary, write_lcr
+from quarters import available_quarters, resolve_quarter
+from raw_loader import load_files
+from risk import add_risk_columns
+from snapshot import current_version_dir, is_outdated, snapshot_csv
+from spatial_index import spread_colocated
+from stage_cache import StageCache, digest
+from timeseries import write_timeseries
+
+# Columns each stage reads from the raw SDWA files, pinned to strings so every chunk parses alike
+SYSTEM_COLUMNS = [
+    'SUBMISSIONYEARQUARTER', 'PWSID', 'PWS_NAME', 'PWS_TYPE_CODE', 'POPULATION_SERVED_COUNT',
+    'OWNER_TYPE_CODE', 'PRIMARY_SOURCE_CODE', 'CITY_NAME', 'STATE_CODE', 'PWS_ACTIVITY_CODE'
+]
+GEO_COLUMNS = [
+    'SUBMISSIONYEARQUARTER', 'PWSID', 'AREA_TYPE_CODE', 'CITY_SERVED', 'STATE_SERVED', 'COUNTY_SERVED', 'ZIP_CODE_SERVED'
+]
+VIOLATION_COLUMNS = ['SUBMISSIONYEARQUARTER', 'PWSID', 'VIOLATION_ID', 'IS_HEALTH_BASED_IND', 'VIOLATION_STATUS']
+
+# PWSIDs start with the state's postal code, so related files can be narrowed to Georgia
+# while they load, before the systems file says exactly which PWSIDs exist
+STATE_PREFIX = 'GA'
+
+# Violation statuses counted as current and as resolved (archived)
+UNADDRESSED_STATUSES = ['Open', 'Unaddressed']
+RESOLVED_STATUSES = ['Resolved', 'Closed', 'Archived', 'Corrected']
 
-def process_water_systems(df, quarter='2025Q1'):
+# Inputs of the coordinate lookup for one system, and what it produces
+COORDINATE_INPUTS = ['city_served', 'county_served', 'CITY_NAME', 'zip_served']
+COORDINATE_COLUMNS = ['latitude', 'longitude', 'has_coordinates', 'location_source', 'location_confidence']
+
+def process_water_systems(df, quarter):
     """Process core water systems data including active and inactive systems"""
     print(f"\n📊 Processing water systems for {quarter}...")
     
@@ -68,7 +89,7 @@ def process_water_systems(df, quarter='2025Q1'):
     
     return systems
 
-def add_geographic_data(systems_df, geo_df, quarter='2025Q1'):
+def add_geographic_data(systems_df, geo_df, quarter):
     """Add geographic information from SDWA_GEOGRAPHIC_AREAS"""
     print("\n🗺️  Adding geographic data...")
     
@@ -77,6 +98,7 @@ def add_geographic_data(systems_df, geo_df, quarter='2025Q1'):
         systems_df['city_served'] = systems_df['CITY_NAME']
         systems_df['county_served'] = ''
         systems_df['state_served'] = systems_df['STATE_CODE']
+        systems_df['zip_served'] = ''
         return systems_df
     
     # Filter for the quarter
@@ -92,19 +114,27 @@ def add_geographic_data(systems_df, geo_df, quarter='2025Q1'):
         ['PWSID', 'COUNTY_SERVED']
     ].drop_duplicates().groupby('PWSID').first().reset_index()
     
+    # Get ZIP code data (ZC = ZIP Code)
+    zips = geo_filtered[geo_filtered['AREA_TYPE_CODE'] == 'ZC'][
+        ['PWSID', 'ZIP_CODE_SERVED']
+    ].dropna().drop_duplicates().groupby('PWSID').first().reset_index()
+    
     # Merge geographic data
     systems_df = systems_df.merge(cities, on='PWSID', how='left')
     systems_df = systems_df.merge(counties, on='PWSID', how='left')
+    systems_df = systems_df.merge(zips, on='PWSID', how='left')
     
     # Fill missing geographic data with system data
     systems_df['city_served'] = systems_df['CITY_SERVED'].fillna(systems_df['CITY_NAME'])
     systems_df['state_served'] = systems_df['STATE_SERVED'].fillna(systems_df['STATE_CODE'])
     systems_df['county_served'] = systems_df['COUNTY_SERVED'].fillna('')
+    # Only ZIPs the system reports serving; a mailing ZIP can be an owner's office anywhere in the state
+    systems_df['zip_served'] = systems_df['ZIP_CODE_SERVED'].fillna('')
     
     print(f"   ✅ Added geographic data for {len(systems_df)} systems")
     return systems_df
 
-def add_violations_data(systems_df, violations_df, quarter='2025Q1'):
+def add_violations_data(systems_df, violations_df, quarter):
     """Add violations summary from SDWA_VIOLATIONS_ENFORCEMENT including archived reports"""
     print("\n⚠️  Processing violations data...")
     
@@ -124,11 +154,11 @@ def add_violations_data(systems_df, violations_df, quarter='2025Q1'):
     viol_stats = viol_filtered.groupby('PWSID').agg({
         'VIOLATION_ID': 'count',
         'IS_HEALTH_BASED_IND': lambda x: (x == 'Y').sum(),
-        'VIOLATION_STATUS': lambda x: (x.isin(['Open', 'Unaddressed'])).sum(),
+        'VIOLATION_STATUS': lambda x: (x.isin(UNADDRESSED_STATUSES)).sum(),
         # Check for archived/resolved violations
         'VIOLATION_STATUS': [
-            lambda x: (x.isin(['Open', 'Unaddressed'])).sum(),
-            lambda x: (x.isin(['Resolved', 'Closed', 'Archived', 'Corrected'])).sum()
+            lambda x: (x.isin(UNADDRESSED_STATUSES)).sum(),
+            lambda x: (x.isin(RESOLVED_STATUSES)).sum()
         ]
     })
     
@@ -156,61 +186,121 @@ def add_violations_data(systems_df, violations_df, quarter='2025Q1'):
     
     return systems_df
 
-def assign_coordinates(systems_df):
+def build_timeseries(systems_df, violations_df):
+    """Population, violation counts and risk for every system in every quarter, in one grouped pass"""
+    print("\n📈 Building quarterly time series...")
+    
+    keys = ['PWSID', 'SUBMISSIONYEARQUARTER']
+    series = systems_df[keys + ['POPULATION_SERVED_COUNT', 'PWS_ACTIVITY_CODE']].drop_duplicates(keys)
+    series['population'] = pd.to_numeric(series['POPULATION_SERVED_COUNT'], errors='coerce').fillna(0).astype(int)
+    series['is_active'] = series['PWS_ACTIVITY_CODE'] == 'A'
+    
+    counts = ['total_violations', 'health_violations', 'unaddressed_violations', 'archived_violations']
+    if violations_df is not None:
+        # Same counting rules as add_violations_data, grouped by quarter as well
+        flags = violations_df[keys + ['VIOLATION_ID']].assign(
+            health=violations_df['IS_HEALTH_BASED_IND'] == 'Y',
+            unaddressed=violations_df['VIOLATION_STATUS'].isin(UNADDRESSED_STATUSES),
+            archived=violations_df['VIOLATION_STATUS'].isin(RESOLVED_STATUSES)
+        )
+        viol_stats = flags.groupby(keys).agg(
+            total_violations=('VIOLATION_ID', 'count'),
+            health_violations=('health', 'sum'),
+            unaddressed_violations=('unaddressed', 'sum'),
+            archived_violations=('archived', 'sum')
+        ).reset_index()
+        series = series.merge(viol_stats, on=keys, how='left')
+    else:
+        series = series.assign(**{column: 0 for column in counts})
+    series[counts] = series[counts].fillna(0).astype(int)
+    
+    series = add_risk_columns(series).rename(columns={'PWSID': 'pwsid', 'SUBMISSIONYEARQUARTER': 'quarter'})
+    quarters = available_quarters(series['quarter'])
+    print(f"   ✅ {len(series)} system-quarters across {len(quarters)} quarters ({quarters[0]} to {quarters[-1]})")
+    return series
+
+def code_digest(stage_cache, *functions):
+    """
+    Digest of this script and the modules defining functions, the code a cached stage runs,
+    so editing any of them invalidates the stage's cached output
+    """
+    paths = [__file__] + sorted({inspect.getfile(function) for function in functions})
+    return digest(*(stage_cache.file_digest(path) for path in paths))
+
+def lookup_coordinates(systems_df, geocoder):
+    """Coordinates for each system from the Georgia locations database, with where they came from"""
+    # Resolved once per distinct place, not once per system
+    coordinates = geocoder.geocode_columns(
+        city=systems_df['city_served'],
+        county=systems_df['county_served'],
+        fallback_city=systems_df['CITY_NAME'],
+        zip_code=systems_df['zip_served']
+    )
+    coordinates.columns = COORDINATE_COLUMNS
+    coordinates.index = systems_df.index
+    return coordinates
+
+def assign_coordinates(systems_df, stage_cache=None):
     """Assign coordinates using the external Georgia locations database"""
     print("\n📍 Assigning coordinates using comprehensive Georgia location database...")
     
-    assigned_coords = 0
-    unassigned_coords = 0
-    
-    def get_system_coordinates(row):
-        nonlocal assigned_coords, unassigned_coords
-        
-        # Try to get coordinates using the imported function
-        lat, lng, found = get_coordinates(
-            city=row['city_served'],
-            county=row['county_served'],
-            fallback_city=row['CITY_NAME']
+    # ZIP codes served are only used when a ZIP centroid table is provided
+    geocoder = OfflineGeocoder()
+    if geocoder.zip_centroids:
+        print(f"   📮 {len(geocoder.zip_centroids)} ZIP centroids from {os.path.basename(ZIP_CENTROIDS_FILE)}")
+    else:
+        print(f"   📮 No {os.path.basename(ZIP_CENTROIDS_FILE)}; ZIP codes served are not used")
+    
+    if stage_cache is None:
+        coordinates = lookup_coordinates(systems_df, geocoder)
+    else:
+        # Only systems whose place names changed (or every system, if the locations database changed) are looked up
+        coordinates = stage_cache.rows(
+            'coordinates', systems_df, 'PWSID', COORDINATE_INPUTS, COORDINATE_COLUMNS,
+            lambda rows: lookup_coordinates(rows, geocoder),
+            context=digest(code_digest(stage_cache, OfflineGeocoder), sorted(geocoder.zip_centroids.items()))
         )
-        
-        if found:
-            assigned_coords += 1
-            return pd.Series([lat, lng, True])
-        else:
-            unassigned_coords += 1
-            return pd.Series([None, None, False])
-    
-    systems_df[['latitude', 'longitude', 'has_coordinates']] = systems_df.apply(get_system_coordinates, axis=1)
+    systems_df[COORDINATE_COLUMNS] = coordinates
     
+    assigned_coords = int(systems_df['has_coordinates'].astype(bool).sum())
+    unassigned_coords = len(systems_df) - assigned_coords
     print(f"   ✅ Assigned known coordinates to {assigned_coords} systems")
     print(f"   ❓ Found {unassigned_coords} systems with unknown coordinates")
+    print(f"   🔎 Matched by: {systems_df['location_source'].value_counts().to_dict()}")
     
     assignment_rate = (assigned_coords / (assigned_coords + unassigned_coords)) * 100
     print(f"   📊 Coordinate assignment rate: {assignment_rate:.1f}%")
     
     return systems_df
 
+def spread_colocated_systems(systems_df):
+    """
+    Move systems that share a centroid apart so their markers don't stack: latitude/longitude become
+    display positions and centroid_latitude/centroid_longitude keep the geocoded point
+    """
+    print("\n🌻 Spreading systems that share a location...")
+    systems_df['centroid_latitude'] = pd.to_numeric(systems_df['latitude'], errors='coerce')
+    systems_df['centroid_longitude'] = pd.to_numeric(systems_df['longitude'], errors='coerce')
+    
+    # Active systems take the innermost places, then PWSID order keeps the layout stable between runs
+    order = systems_df['is_active'].map({True: '0', False: '1'}) + systems_df['PWSID']
+    lats, lngs, sizes = spread_colocated(
+        systems_df['centroid_latitude'].to_numpy(), systems_df['centroid_longitude'].to_numpy(), order.to_numpy()
+    )
+    # Six decimals is ~0.1 m, far finer than the spacing, and keeps the CSV compact
+    systems_df['latitude'] = lats.round(6)
+    systems_df['longitude'] = lngs.round(6)
+    
+    groups = sizes[sizes > 1]
+    print(f"   ✅ Spread {len(groups)} systems sharing {round((1 / groups).sum())} locations "
+          f"(largest group: {int(groups.max()) if len(groups) else 0})")
+    return systems_df
+
 def calculate_risk_levels(systems_df):
     """Calculate risk levels based on violations"""
     print("\n🚨 Calculating risk levels...")
     
-    def get_risk_level(row):
-        health_violations = row['health_violations']
-        unaddressed = row['unaddressed_violations']
-        total_violations = row['total_violations']
-        
-        if health_violations > 0:
-            return 'High', 'red'
-        elif unaddressed > 0:
-            return 'Medium', 'orange'
-        elif total_violations > 0:
-            return 'Low', 'yellow'
-        else:
-            return 'Good', 'green'
-    
-    systems_df[['risk_level', 'marker_color']] = systems_df.apply(
-        lambda row: pd.Series(get_risk_level(row)), axis=1
-    )
+    systems_df = add_risk_columns(systems_df)
     
     risk_counts = systems_df['risk_level'].value_counts()
     print(f"   Risk distribution: {dict(risk_counts)}")
@@ -238,14 +328,14 @@ def create_polished_data(systems_df):
     polished = systems_df[[
         'PWSID', 'PWS_NAME', 'PWS_TYPE_CODE', 'POPULATION_SERVED_COUNT',
         'OWNER_TYPE_CODE', 'PRIMARY_SOURCE_CODE', 'address', 'latitude', 'longitude',
-        'total_violations', 'health_violations', 'unaddressed_violations', 'archived_violations',
+        'centroid_latitude', 'centroid_longitude', 'total_violations', 'health_violations', 'unaddressed_violations', 'archived_violations',
         'risk_level', 'marker_color', 'has_coordinates', 'is_active', 'activity_status', 'has_archived_reports'
     ]].copy()
     
     # Rename columns to clean names
     polished.columns = [
         'pwsid', 'name', 'type', 'population', 'owner_type', 'primary_source',
-        'address', 'lat', 'lng', 'total_violations', 'health_violations',
+        'address', 'lat', 'lng', 'centroid_lat', 'centroid_lng', 'total_violations', 'health_violations',
         'unaddressed_violations', 'archived_violations', 'risk_level', 'marker_color', 
         'has_coordinates', 'is_active', 'activity_status', 'has_archived_reports'
     ]
@@ -263,6 +353,8 @@ def create_polished_data(systems_df):
     # Handle lat/lng - only convert to float if not null
     polished['lat'] = pd.to_numeric(polished['lat'], errors='coerce')
     polished['lng'] = pd.to_numeric(polished['lng'], errors='coerce')
+    polished['centroid_lat'] = pd.to_numeric(polished['centroid_lat'], errors='coerce')
+    polished['centroid_lng'] = pd.to_numeric(polished['centroid_lng'], errors='coerce')
     
     # Statistics
     systems_with_coords = len(polished[polished['has_coordinates'] == True])
@@ -280,17 +372,27 @@ def create_polished_data(systems_df):
     
     return polished
 
+def diff_polished(previous_text, text):
+    """Added, removed and changed PWSIDs between two renderings of the polished CSV"""
+    def rows(csv_text):
+        return {row[0]: row for row in csv.reader(io.StringIO(csv_text)) if row and row[0] != 'pwsid'}
+    
+    before, after = rows(previous_text), rows(text)
+    added = sorted(after.keys() - before.keys())
+    removed = sorted(before.keys() - after.keys())
+    changed = sorted(p for p in after.keys() & before.keys() if after[p] != before[p])
+    return added, removed, changed
+
 def main():
     """Main processing function"""
     print("🚰 SDWIS Data Preprocessing Script (Improved Version)")
     print("=" * 60)
     
-    # Configuration
-    quarter = '2025Q1'
+    # Configuration (the polished dataset is the latest quarter unless one is given)
+    quarter = sys.argv[1] if len(sys.argv) > 1 else None
     data_dir = 'data'
     output_file = os.path.join(data_dir, 'polished_data.csv')
     
-    print(f"📅 Processing quarter: {quarter}")
     print(f"📁 Data directory: {data_dir}")
     print(f"📄 Output file: {output_file}")
     
@@ -299,27 +401,123 @@ def main():
         print(f"❌ Data directory not found: {data_dir}")
         sys.exit(1)
     
-    # Load raw data
+    # Load raw data, keeping only Georgia rows (every quarter) as each file streams past
     print(f"\n📥 Loading raw CSV files...")
-    systems_df = load_csv_safe(os.path.join(data_dir, 'SDWA_PUB_WATER_SYSTEMS.csv'))
-    geo_df = load_csv_safe(os.path.join(data_dir, 'SDWA_GEOGRAPHIC_AREAS.csv'))
-    violations_df = load_csv_safe(os.path.join(data_dir, 'SDWA_VIOLATIONS_ENFORCEMENT.csv'))
-    
-    if systems_df is None:
+    # Stage outputs are cached by the content of everything upstream, so unchanged stages are skipped
+    stage_cache = StageCache(os.path.join(data_dir, 'preprocess_cache'))
+    systems_file = os.path.join(data_dir, 'SDWA_PUB_WATER_SYSTEMS.csv')
+    geo_file = os.path.join(data_dir, 'SDWA_GEOGRAPHIC_AREAS.csv')
+    violations_file = os.path.join(data_dir, 'SDWA_VIOLATIONS_ENFORCEMENT.csv')
+    lcr_file = os.path.join(data_dir, 'SDWA_LCR_SAMPLES.csv')
+    
+    # All four files are parsed at once, each keeping only Georgia rows (every quarter) as it streams past
+    frames, timings = load_files({
+        'systems': {'path': systems_file, 'columns': SYSTEM_COLUMNS, 'filters': {'STATE_CODE': {'GA'}}},
+        'geo': {'path': geo_file, 'columns': GEO_COLUMNS, 'filters': {'PWSID': STATE_PREFIX}},
+        'violations': {'path': violations_file, 'columns': VIOLATION_COLUMNS, 'filters': {'PWSID': STATE_PREFIX}},
+        'lcr': {'path': lcr_file, 'columns': LCR_COLUMNS, 'filters': {'PWSID': STATE_PREFIX}},
+    }, stage_cache=stage_cache)
+    with open(os.path.join(stage_cache.cache_dir, 'load_timings.json'), 'w') as f:
+        json.dump(timings, f, indent=2)
+    all_systems_df = frames['systems']
+    
+    if all_systems_df is None:
         print("❌ Cannot proceed without water systems data")
         sys.exit(1)
     
+    quarters = available_quarters(all_systems_df['SUBMISSIONYEARQUARTER'])
+    quarter = resolve_quarter(quarter, quarters)
+    print(f"📅 Processing quarter: {quarter} ({len(quarters)} quarters in the data)")
+    
+    # Related files only need rows for the systems being processed; geography only for the polished quarter
+    pwsids = set(all_systems_df['PWSID'])
+    
+    # They were read by PWSID prefix so all files could be parsed at once; Georgia systems with another
+    # state's prefix get their rows from a second, exact pass, so the semi-join still covers every system
+    others = {pwsid for pwsid in pwsids if not pwsid.startswith(STATE_PREFIX)}
+    if others:
+        print(f"🔗 {len(others)} Georgia systems have another state's PWSID prefix; reading their rows as well")
+        related = {'geo': (geo_file, GEO_COLUMNS), 'violations': (violations_file, VIOLATION_COLUMNS),
+                   'lcr': (lcr_file, LCR_COLUMNS)}
+        extra, _ = load_files({
+            name: {'path': path, 'columns': columns, 'filters': {'PWSID': others}}
+            for name, (path, columns) in related.items() if frames[name] is not None
+        }, stage_cache=stage_cache, cache_name='load-other-states')
+        for name, df in extra.items():
+            if df is not None:
+                frames[name] = pd.concat([frames[name], df], ignore_index=True)
+    geo_df, violations_df, lcr_samples_df = frames['geo'], frames['violations'], frames['lcr']
+    if geo_df is not None:
+        geo_df = geo_df[(geo_df['SUBMISSIONYEARQUARTER'] == quarter) & geo_df['PWSID'].isin(pwsids)].reset_index(drop=True)
+    if violations_df is not None:
+        violations_df = violations_df[violations_df['PWSID'].isin(pwsids)].reset_index(drop=True)
+    if lcr_samples_df is not None:
+        lcr_samples_df = lcr_samples_df[lcr_samples_df['PWSID'].isin(pwsids)].reset_index(drop=True)
+    
+    # Each stage's key chains the keys of the stages and files it depends on, starting from the code it runs
+    # (so a change to how a stage works invalidates its cached output)
+    systems_key = digest(code_digest(stage_cache), stage_cache.file_digest(systems_file), quarter)
+    geo_key = digest(systems_key, stage_cache.file_digest(geo_file))
+    violations_key = digest(geo_key, stage_cache.file_digest(violations_file))
+    timeseries_key = digest(code_digest(stage_cache, available_quarters, add_risk_columns, write_timeseries),
+                            stage_cache.file_digest(systems_file), stage_cache.file_digest(violations_file))
+    lcr_key = digest(code_digest(stage_cache, build_lcr_summary),
+                     stage_cache.file_digest(systems_file), stage_cache.file_digest(lcr_file))
+    
+    # History of every quarter for the trend API
+    timeseries_df = stage_cache.stage('timeseries', timeseries_key,
+                                      lambda: build_timeseries(all_systems_df, violations_df))
+    
+    # Lead and copper summary for the LCR API (every monitoring period, not just the polished quarter)
+    lcr_df = None
+    if lcr_samples_df is not None:
+        lcr_df = stage_cache.stage('lcr', lcr_key, lambda: build_lcr_summary(lcr_samples_df))
+    
     # Process data step by step
-    systems_df = process_water_systems(systems_df, quarter)
-    systems_df = add_geographic_data(systems_df, geo_df, quarter)
-    systems_df = add_violations_data(systems_df, violations_df, quarter)
-    systems_df = assign_coordinates(systems_df)
+    systems_df = stage_cache.stage('systems', systems_key, lambda: process_water_systems(all_systems_df, quarter))
+    systems_df = stage_cache.stage('geography', geo_key, lambda: add_geographic_data(systems_df, geo_df, quarter))
+    systems_df = stage_cache.stage('violations', violations_key,
+                                   lambda: add_violations_data(systems_df, violations_df, quarter))
+    systems_df = assign_coordinates(systems_df, stage_cache)
+    systems_df = spread_colocated_systems(systems_df)
     systems_df = calculate_risk_levels(systems_df)
     polished_df = create_polished_data(systems_df)
     
-    # Save polished data
-    print(f"\n💾 Saving polished data to {output_file}...")
-    polished_df.to_csv(output_file, index=False)
+    # Compare with the current output per PWSID; nothing is rewritten (or reloaded by the backend) if no system changed
+    csv_text = polished_df.to_csv(index=False)
+    previous_text = ''
+    if os.path.exists(output_file):
+        with open(output_file, newline='') as f:
+            previous_text = f.read()
+    added, removed, changed = diff_polished(previous_text, csv_text)
+    print(f"\n🔁 Changes since last run: {len(added)} added, {len(removed)} removed, {len(changed)} changed systems")
+    with open(os.path.join(stage_cache.cache_dir, 'last_changes.json'), 'w') as f:
+        json.dump({"quarter": quarter, "added": added, "removed": removed, "changed": changed}, f, indent=2)
+    
+    if csv_text != previous_text or is_outdated(current_version_dir(os.path.join(data_dir, 'polished_snapshot'))):
+        # Save polished data
+        print(f"\n💾 Saving polished data to {output_file}...")
+        # Write to a temp file and rename so a running backend never reads a half-written CSV
+        tmp_file = output_file + '.tmp'
+        with open(tmp_file, 'w', newline='') as f:
+            f.write(csv_text)
+        os.replace(tmp_file, output_file)
+        
+        # Columnar snapshot the backend loads instead of re-parsing the CSV
+        snapshot_dir = snapshot_csv(output_file)
+        print(f"💾 Saved columnar snapshot to {snapshot_dir}")
+    else:
+        print(f"\n✅ {output_file} is already up to date")
+    
+    timeseries_root = os.path.join(data_dir, 'timeseries')
+    if 'timeseries' not in stage_cache.hits or current_version_dir(timeseries_root) is None:
+        timeseries_dir = write_timeseries(timeseries_df, timeseries_root)
+        print(f"💾 Saved quarterly time series to {timeseries_dir}")
+    
+    lcr_root = os.path.join(data_dir, 'lcr')
+    if lcr_df is not None and ('lcr' not in stage_cache.hits or current_version_dir(lcr_root) is None):
+        lcr_dir = write_lcr(lcr_df, lcr_root)
+        print(f"💾 Saved lead and copper summary to {lcr_dir}")
     
     # Summary
     print(f"\n📊 Processing Summary:")
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Reporting Quarters
+SUBMISSIONYEARQUARTER helpers shared by preprocess_data.py and sdwis_pipeline.py
+"""
+
+import pandas as pd
+
+
+def available_quarters(values):
+    """Distinct quarters, oldest first ('2024Q4' < '2025Q1' as strings)"""
+    return sorted(str(q) for q in pd.unique(pd.Series(values).dropna()))
+
+
+def resolve_quarter(requested, available):
+    """The quarter to process: requested if present, otherwise the latest one in the data"""
+    if not available or requested in available:
+        return requested
+    if requested:
+        print(f"⚠️  Quarter {requested} not found in the data, using latest ({available[-1]})")
+    return available[-1]
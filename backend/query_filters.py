@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Query Filters
+Search-style filters (q, risk, county, type, fuzzy) shared by the search, aggregate and export endpoints
+"""
+
+import numpy as np
+import pandas as pd
+
+from risk import RISK_LEVELS
+from search_index import tokenize
+
+# Case-insensitive lookup for the risk filter
+RISK_BY_NAME = {level.lower(): level for level in RISK_LEVELS}
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+# Which systems the active filter selects
+ACTIVE_VALUES = ('true', 'false', 'all')
+
+
+def parse_filters(args):
+    """Read filters from request args"""
+    county = args.get('county', '').strip()
+    if county.lower().endswith(' county'):
+        county = county[:-len(' county')]
+
+    return {
+        "q": args.get('q', '').strip().lower(),
+        "risk": args.get('risk', '').strip(),
+        "county": county,
+        "type": args.get('type', '').strip().upper(),
+        "fuzzy": args.get('fuzzy', 'false').lower() in TRUE_VALUES,
+    }
+
+
+def filter_key(filters):
+    """Hashable, order-independent form of filters for cache and cursor keys"""
+    return tuple(sorted(filters.items()))
+
+
+def parse_active(value):
+    value = (value or 'true').strip().lower()
+    if value not in ACTIVE_VALUES:
+        raise ValueError(f"active must be one of: {', '.join(ACTIVE_VALUES)}")
+    return value
+
+
+def _filter_columns(columns, ids, filters):
+    """Apply the risk, county and type filters to ids"""
+    if filters['risk']:
+        ids = ids[columns['risk_level'][ids] == RISK_BY_NAME.get(filters['risk'].lower())]
+    if filters['county']:
+        ids = ids[np.char.lower(columns['county'][ids].astype(str)) == filters['county'].lower()]
+    if filters['type']:
+        ids = ids[columns['type'][ids] == filters['type']]
+    return ids
+
+
+def select_systems(store, filters):
+    """
+    Active systems matching filters, in search rank order
+    Returns: (ids into store.systems, fuzzy corrections)
+    """
+    corrections = {}
+    if filters['fuzzy']:
+        ids, corrections = store.search_index.fuzzy_search(filters['q'])
+    else:
+        ids = store.search_index.search(filters['q'])
+    return _filter_columns(store.columns, ids, filters), corrections
+
+
+def scan_systems(columns, rows, filters):
+    """
+    Rows matching filters by scanning the columns, for systems outside the search index.
+    Tokens match like the index does (substring of a word, or word prefix below three characters);
+    fuzzy matching is not applied.
+    """
+    tokens = tokenize(filters['q'])
+    if tokens and len(rows):
+        text = pd.Series(columns['name'][rows], dtype=object).fillna('').str.lower()
+        for name in ('address', 'city', 'county', 'pwsid'):
+            text = text + ' ' + pd.Series(columns[name][rows], dtype=object).fillna('').str.lower()
+
+        matched = np.ones(len(rows), dtype=bool)
+        for token in tokens:
+            if len(token) < 3:
+                matched &= text.str.contains(r'(?:^|[^a-z0-9])' + token, regex=True).to_numpy()
+            else:
+                matched &= text.str.contains(token, regex=False).to_numpy()
+        rows = rows[matched]
+    return _filter_columns(columns, rows, filters)
+
+
+def select_all_systems(store, filters, active='true'):
+    """
+    Rows of store.all_columns matching filters and the active filter, in PWSID order.
+    Active systems are looked up in the search index; inactive ones, which it does not cover, are scanned.
+    """
+    is_active = store.all_columns['is_active']
+    selected = [np.empty(0, dtype=np.int64)]
+    if active in ('true', 'all'):
+        ids, _ = select_systems(store, filters)
+        selected.append(np.flatnonzero(is_active)[ids])
+    if active in ('false', 'all'):
+        selected.append(scan_systems(store.all_columns, np.flatnonzero(~is_active), filters))
+    rows = np.sort(np.concatenate(selected))
+    # Rows hold active systems first; merge both partitions back into PWSID order
+    return rows[np.argsort(np.asarray(store.all_columns['pwsid'][rows], dtype=object), kind='stable')]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+Encoded (and pre-compressed) JSON responses keyed by dataset version, served with strong ETags
+"""
+
+import gzip
+import hashlib
+import json
+
+from flask import Response
+
+from lru_cache import LRUCache
+
+# Optional faster encoder and better compression; plain json and gzip are used without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+
+def encode_json(payload):
+    """Compact UTF-8 JSON bytes for payload"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+class EncodedResponse:
+    """One JSON body with its compressed variants and ETag"""
+
+    def __init__(self, body):
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.bodies = {'identity': body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.bodies['gzip'] = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body, quality=5)
+
+    def response(self, request):
+        """Best variant for the request's Accept-Encoding, or 304 if the client's copy is current"""
+        encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in self.bodies])
+        encoding = encoding or 'identity'
+
+        response = Response(self.bodies[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # Strong ETags are per representation, so compressed variants get their own
+        response.set_etag(self.etag if encoding == 'identity' else f"{self.etag}-{encoding}")
+        # Clients may keep the body but must revalidate, since a reload can change it at any time
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+class ResponseCache:
+    """LRU of encoded responses; keys include the dataset version so a reload never serves stale data"""
+
+    def __init__(self, max_items=256):
+        self._responses = LRUCache(max_items)
+
+    def respond(self, request, key, build):
+        """Serve the cached response for key, calling build() for the payload on a miss"""
+        encoded = self._responses.get_or_build(key, lambda: EncodedResponse(encode_json(build())))
+        return encoded.response(request)
+
+    def clear(self):
+        self._responses.clear()
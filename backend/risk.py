@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Risk Classification Engine
+Vectorized risk levels and marker colors shared by preprocess_data.py, sdwis_pipeline.py and the API
+"""
+
+import numpy as np
+import pandas as pd
+
+# Ordered from worst to best; a risk code is the index into this tuple
+RISK_LEVELS = ('High', 'Medium', 'Low', 'Good')
+RISK_COLORS = ('red', 'orange', 'yellow', 'green')
+
+_LEVELS = np.array(RISK_LEVELS, dtype=object)
+_COLORS = np.array(RISK_COLORS, dtype=object)
+
+
+def _counts(values):
+    """Coerce a violation column to a float array with missing values as 0"""
+    return np.nan_to_num(np.asarray(values, dtype=float))
+
+
+def risk_codes(health_violations, unaddressed_violations, total_violations):
+    """
+    Classify systems by violation counts, returning small-int risk codes:
+    0. High - unaddressed violations that include health-based ones
+    1. Medium - other unaddressed violations
+    2. Low - only resolved violations on record
+    3. Good - no violations
+    """
+    health = _counts(health_violations)
+    unaddressed = _counts(unaddressed_violations)
+    total = _counts(total_violations)
+
+    conditions = [
+        # Only count health violations that are still unaddressed
+        np.minimum(health, unaddressed) > 0,
+        unaddressed > 0,
+        total > 0,
+    ]
+    return np.select(conditions, [0, 1, 2], default=3).astype(np.int8)
+
+
+def classify_risk(health_violations, unaddressed_violations, total_violations):
+    """
+    Vectorized risk classification
+    Returns: (risk_level array, marker_color array)
+    """
+    codes = risk_codes(health_violations, unaddressed_violations, total_violations)
+    return _LEVELS[codes], _COLORS[codes]
+
+
+def add_risk_columns(df: pd.DataFrame,
+                     health_col: str = 'health_violations',
+                     unaddressed_col: str = 'unaddressed_violations',
+                     total_col: str = 'total_violations') -> pd.DataFrame:
+    """Set risk_level and marker_color on a DataFrame of violation counts"""
+    levels, colors = classify_risk(df[health_col], df[unaddressed_col], df[total_col])
+    df['risk_level'] = levels
+    df['marker_color'] = colors
+    return df
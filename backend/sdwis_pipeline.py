@@ -1,26 +1,61 @@
 import pandas as pd
-import requests
-import time
 import os
-from typing import Tuple, Optional, Dict, Any
+from typing import Tuple, Optional, Dict, Any, List
+
+from geocoder import AsyncGeocoder
+from georgia_locations import OfflineGeocoder
+from quarters import available_quarters, resolve_quarter
+from raw_loader import load_files
+from risk import add_risk_columns
+
+# Raw files the pipeline stages read
+RAW_FILES = {
+    'systems': 'SDWA_PUB_WATER_SYSTEMS.csv',
+    'geo': 'SDWA_GEOGRAPHIC_AREAS.csv',
+    'violations': 'SDWA_VIOLATIONS_ENFORCEMENT.csv',
+}
+
+# Offline matches at least this confident (city or ZIP) are used without asking the external geocoder
+LOCAL_CONFIDENCE = 0.8
 
 class SDWISDataPipeline:
     def __init__(self, data_dir: str, google_api_key: Optional[str] = None):
         self.data_dir = data_dir
         self.google_api_key = google_api_key
-        self.geocode_cache = {}
+        # Created on first use; shares one connection pool and on-disk cache across calls
+        self.geocoder: Optional[AsyncGeocoder] = None
+        # Quarter the last load_water_systems call resolved to; later stages default to it
+        self.quarter = None
+        # Parsed raw files, loaded together on first use and shared by every stage
+        self.frames: Dict[str, Optional[pd.DataFrame]] = {}
+        self.load_timings: Dict[str, Dict[str, Any]] = {}
+        
+    def load_raw_files(self) -> Dict[str, Optional[pd.DataFrame]]:
+        """Parse every raw file the pipeline needs concurrently; later calls reuse the parsed frames"""
+        specs = {
+            name: {'path': os.path.join(self.data_dir, filename), 'dtype': None}
+            for name, filename in RAW_FILES.items() if name not in self.frames
+        }
+        if specs:
+            frames, timings = load_files(specs)
+            self.frames.update(frames)
+            self.load_timings.update(timings)
+        return self.frames
+    
+    def _raw(self, name: str) -> pd.DataFrame:
+        frame = self.load_raw_files()[name]
+        if frame is None:
+            raise FileNotFoundError(os.path.join(self.data_dir, RAW_FILES[name]))
+        return frame
         
-    def load_water_systems(self, quarter: str = "2023Q4") -> pd.DataFrame:
-        """Load and filter core system data for active systems"""
+    def load_water_systems(self, quarter: Optional[str] = None) -> pd.DataFrame:
+        """Load and filter core system data for active systems (latest quarter unless one is given)"""
         try:
-            systems_path = os.path.join(self.data_dir, "SDWA_PUB_WATER_SYSTEMS.csv")
-            systems = pd.read_csv(systems_path, low_memory=False)
+            systems = self._raw('systems')
             
-            # Filter for latest available quarter and active systems
-            available_quarters = systems['SUBMISSIONYEARQUARTER'].unique()
-            if quarter not in available_quarters:
-                # Use the most recent quarter available
-                quarter = sorted(available_quarters)[-1] if len(available_quarters) > 0 else quarter
+            # Filter for the requested quarter, or the most recent one available
+            quarter = resolve_quarter(quarter, available_quarters(systems['SUBMISSIONYEARQUARTER']))
+            self.quarter = quarter
             
             filtered_systems = systems[
                 (systems['SUBMISSIONYEARQUARTER'] == quarter)
@@ -37,11 +72,11 @@ class SDWISDataPipeline:
             print(f"Error loading water systems: {e}")
             return pd.DataFrame()
     
-    def add_geographic_data(self, systems: pd.DataFrame, quarter: str = "2023Q4") -> pd.DataFrame:
+    def add_geographic_data(self, systems: pd.DataFrame, quarter: Optional[str] = None) -> pd.DataFrame:
         """Add geographic information from SDWA_GEOGRAPHIC_AREAS.csv"""
+        quarter = quarter or self.quarter
         try:
-            geo_path = os.path.join(self.data_dir, "SDWA_GEOGRAPHIC_AREAS.csv")
-            geo_areas = pd.read_csv(geo_path, low_memory=False)
+            geo_areas = self._raw('geo')
             
             # Filter for the same quarter
             geo_areas = geo_areas[geo_areas['SUBMISSIONYEARQUARTER'] == quarter]
@@ -77,11 +112,11 @@ class SDWISDataPipeline:
             print(f"Error adding geographic data: {e}")
             return systems
     
-    def add_violation_summary(self, systems: pd.DataFrame, quarter: str = "2023Q4") -> pd.DataFrame:
+    def add_violation_summary(self, systems: pd.DataFrame, quarter: Optional[str] = None) -> pd.DataFrame:
         """Add violation summary data"""
+        quarter = quarter or self.quarter
         try:
-            violations_path = os.path.join(self.data_dir, "SDWA_VIOLATIONS_ENFORCEMENT.csv")
-            violations = pd.read_csv(violations_path, low_memory=False)
+            violations = self._raw('violations')
             
             # Filter for the same quarter  
             violations = violations[violations['SUBMISSIONYEARQUARTER'] == quarter]
@@ -110,94 +145,91 @@ class SDWISDataPipeline:
             systems['unaddressed_violations'] = 0
             return systems
     
+    def _get_geocoder(self) -> AsyncGeocoder:
+        if self.geocoder is None:
+            self.geocoder = AsyncGeocoder(
+                self.google_api_key,
+                cache_path=os.path.join(self.data_dir, 'geocode_cache.sqlite'),
+                concurrency=int(os.environ.get('GEOCODE_CONCURRENCY', 8)),
+                rate=float(os.environ.get('GEOCODE_RATE', 20)),
+            )
+        return self.geocoder
+    
     def geocode_location(self, address: str) -> Tuple[Optional[float], Optional[float]]:
         """Convert address to lat/lng using Google Geocoding API"""
+        return self.geocode_addresses([address])[address]
+    
+    def geocode_addresses(self, addresses: List[str]) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+        """Geocode many addresses concurrently (rate-limited, cached on disk across runs)"""
         if not self.google_api_key:
-            return None, None
-            
-        # Check cache first
-        if address in self.geocode_cache:
-            return self.geocode_cache[address]
+            return {address: (None, None) for address in addresses}
+        geocoder = self._get_geocoder()
+        coordinates = geocoder.geocode_all(addresses)
+        print(f"Geocoded {len(set(addresses))} addresses: {geocoder.stats}")
+        return coordinates
+    
+    def _system_address(self, system: pd.Series) -> Optional[str]:
+        """Address to geocode for a system, or None if it has no location fields"""
+        address_parts = []
         
-        base_url = "https://maps.googleapis.com/maps/api/geocode/json"
-        params = {
-            'address': address,
-            'key': self.google_api_key
-        }
+        # Priority order: ZIP > City > County
+        if pd.notna(system.get('ZIP_CODE_SERVED')):
+            address_parts.append(str(system['ZIP_CODE_SERVED']))
+        elif pd.notna(system.get('CITY_SERVED')):
+            address_parts.append(str(system['CITY_SERVED']))
+        elif pd.notna(system.get('COUNTY_SERVED')):
+            address_parts.append(f"{system['COUNTY_SERVED']} County")
         
-        try:
-            response = requests.get(base_url, params=params)
-            data = response.json()
-            
-            if data['status'] == 'OK' and len(data['results']) > 0:
-                location = data['results'][0]['geometry']['location']
-                lat, lng = location['lat'], location['lng']
-                self.geocode_cache[address] = (lat, lng)
-                return lat, lng
-            else:
-                self.geocode_cache[address] = (None, None)
-                return None, None
-        except Exception as e:
-            print(f"Geocoding error for {address}: {e}")
-            return None, None
+        # Add state
+        if pd.notna(system.get('STATE_SERVED')):
+            address_parts.append(str(system['STATE_SERVED']))
+        elif pd.notna(system.get('STATE_CODE')):
+            address_parts.append(str(system['STATE_CODE']))
+        
+        return ", ".join(address_parts) if address_parts else None
     
     def create_map_ready_data(self, systems: pd.DataFrame, use_geocoding: bool = True) -> pd.DataFrame:
         """Create map-ready data with coordinates and risk levels"""
         map_data = []
         
-        for idx, system in systems.iterrows():
-            # Build address for geocoding
-            address_parts = []
-            
-            # Priority order: ZIP > City > County
-            if pd.notna(system.get('ZIP_CODE_SERVED')):
-                address_parts.append(str(system['ZIP_CODE_SERVED']))
-            elif pd.notna(system.get('CITY_SERVED')):
-                address_parts.append(str(system['CITY_SERVED']))
-            elif pd.notna(system.get('COUNTY_SERVED')):
-                address_parts.append(f"{system['COUNTY_SERVED']} County")
-            
-            # Add state
-            if pd.notna(system.get('STATE_SERVED')):
-                address_parts.append(str(system['STATE_SERVED']))
-            elif pd.notna(system.get('STATE_CODE')):
-                address_parts.append(str(system['STATE_CODE']))
-            
-            if not address_parts:
-                continue
-                
-            address = ", ".join(address_parts)
-            
-            # Get coordinates
-            if use_geocoding and self.google_api_key:
-                lat, lng = self.geocode_location(address)
-                # Rate limiting for API calls
-                time.sleep(0.1)
+        # Classify every system up front instead of once per row
+        systems = add_risk_columns(systems.copy())
+        
+        # Resolve what we can offline (once per distinct place); only the rest needs the external geocoder
+        matches = OfflineGeocoder().geocode_columns(
+            city=systems.get('CITY_SERVED'),
+            county=systems.get('COUNTY_SERVED'),
+            zip_code=systems.get('ZIP_CODE_SERVED')
+        )
+        located = []
+        for (idx, system), match in zip(systems.iterrows(), matches.itertuples(index=False)):
+            address = self._system_address(system)
+            if address is not None:
+                located.append((system, address, match))
+        
+        # Geocode every distinct remaining address in one concurrent batch
+        coordinates = {}
+        if use_geocoding and self.google_api_key:
+            coordinates = self.geocode_addresses(
+                [address for _, address, match in located if match.confidence < LOCAL_CONFIDENCE]
+            )
+        
+        for system, address, match in located:
+            if match.confidence >= LOCAL_CONFIDENCE or address not in coordinates or coordinates[address][0] is None:
+                # Offline match (a county centroid at worst) when nothing better came back
+                lat, lng, source, confidence = match.lat, match.lng, match.source, match.confidence
             else:
-                lat, lng = None, None
+                lat, lng = coordinates[address]
+                source, confidence = 'geocoded', 1.0
             
             # If geocoding failed or disabled, skip this system for now
-            if lat is None or lng is None:
+            if pd.isna(lat) or pd.isna(lng):
                 continue
             
-            # Determine risk level and marker color based on violations
             health_violations = system.get('health_violations', 0)
             unaddressed = system.get('unaddressed_violations', 0)
             total_violations = system.get('total_violations', 0)
             
-            if health_violations > 0:
-                marker_color = 'red'
-                risk_level = 'High'
-            elif unaddressed > 0:
-                marker_color = 'orange'
-                risk_level = 'Medium'
-            elif total_violations > 0:
-                marker_color = 'yellow'
-                risk_level = 'Low'
-            else:
-                marker_color = 'green'
-                risk_level = 'Good'
-            
             map_data.append({
                 'pwsid': system['PWSID'],
                 'name': system['PWS_NAME'],
@@ -206,22 +238,25 @@ class SDWISDataPipeline:
                 'lat': lat,
                 'lng': lng,
                 'address': address,
-                'marker_color': marker_color,
-                'risk_level': risk_level,
+                'marker_color': system['marker_color'],
+                'risk_level': system['risk_level'],
                 'total_violations': int(total_violations),
                 'health_violations': int(health_violations),
-                'unaddressed_violations': int(unaddressed)
+                'unaddressed_violations': int(unaddressed),
+                'location_source': source,
+                'location_confidence': confidence
             })
         
         return pd.DataFrame(map_data)
     
-    def process_full_pipeline(self, quarter: str = "2023Q4", use_geocoding: bool = False) -> pd.DataFrame:
-        """Run the full SDWIS pipeline"""
-        print(f"Starting SDWIS pipeline for quarter {quarter}...")
+    def process_full_pipeline(self, quarter: Optional[str] = None, use_geocoding: bool = False) -> pd.DataFrame:
+        """Run the full SDWIS pipeline (latest quarter in the data unless one is given)"""
+        print(f"Starting SDWIS pipeline for quarter {quarter or 'latest'}...")
         
-        # Step 1: Load water systems
+        # Step 1: Load water systems; every later stage uses the quarter it resolved to
         systems = self.load_water_systems(quarter)
-        print(f"Loaded {len(systems)} water systems")
+        quarter = self.quarter
+        print(f"Loaded {len(systems)} water systems for {quarter}")
         
         if systems.empty:
             return pd.DataFrame()
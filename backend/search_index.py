@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Water System Search Index
+Prebuilt inverted index over system name, address, city, county and PWSID.
+Every index is held as flat NumPy arrays (sorted fixed-width vocabularies, packed postings), so a
+built index can be saved with a dataset snapshot and served from the memory-mapped files as is.
+"""
+
+import re
+from collections import defaultdict
+
+import numpy as np
+
+from lru_cache import LRUCache
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Rank tiers, best first
+RANK_PWSID = 0
+RANK_NAME_PREFIX = 1
+RANK_NAME_MATCH = 2
+RANK_OTHER_FIELD = 3
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens of a query or field"""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def padded_trigrams(word):
+    """Trigrams of a word padded with two leading and one trailing space"""
+    return trigrams(f'  {word} ')
+
+
+def bounded_levenshtein(a, b, max_distance):
+    """Edit distance between a and b, or max_distance + 1 once it is known to exceed the bound"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+
+def max_edits(token):
+    """Typos tolerated for a token of this length"""
+    if len(token) <= 3:
+        return 0
+    if len(token) <= 5:
+        return 1
+    return 2
+
+
+def _sorted_ids(ids):
+    return np.fromiter(sorted(ids), dtype=np.int32, count=len(ids))
+
+
+def _strings(values):
+    """Sorted-order-preserving fixed-width unicode array (at least one character wide)"""
+    values = list(values)
+    width = max(max(map(len, values), default=1), 1)
+    return np.array(values, dtype=f'U{width}')
+
+
+def _find(keys, values):
+    """Positions of values in the sorted array keys, -1 where a value is absent"""
+    # Natural width: casting to the keys' width would truncate longer values into false matches
+    values = np.array(values, dtype=str)
+    if not len(keys):
+        return np.full(len(values), -1, dtype=np.int64)
+    positions = keys.searchsorted(values)
+    return np.where(keys.take(positions, mode='clip') == values, positions, -1)
+
+
+def _prefixed(prefix, arrays):
+    return {f'{prefix}.{name}': array for name, array in arrays.items()}
+
+
+def _unprefixed(prefix, arrays):
+    start = len(prefix) + 1
+    return {name[start:]: array for name, array in arrays.items() if name.startswith(prefix + '.')}
+
+
+class PackedLists:
+    """Read-only sequence of int32 arrays stored as one flat array plus offsets"""
+
+    def __init__(self, arrays):
+        self.offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in arrays], out=self.offsets[1:])
+        self.values = np.concatenate(arrays).astype(np.int32) if arrays else _EMPTY
+        self.values.flags.writeable = False
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        packed = cls.__new__(cls)
+        packed.offsets, packed.values = arrays['offsets'], arrays['values']
+        return packed
+
+    def arrays(self):
+        return {'offsets': self.offsets, 'values': self.values}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+
+class GramIndex:
+    """Sorted grams, each with the positions of the words containing it"""
+
+    def __init__(self, words, grams_of):
+        grams = defaultdict(list)
+        for w, word in enumerate(words):
+            for gram in grams_of(word):
+                grams[gram].append(w)
+        self.keys = _strings(sorted(grams))
+        self.words = PackedLists([np.array(grams[gram], dtype=np.int32) for gram in self.keys.tolist()])
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index.keys = arrays['keys']
+        index.words = PackedLists.from_arrays(_unprefixed('words', arrays))
+        return index
+
+    def arrays(self):
+        return {'keys': self.keys, **_prefixed('words', self.words.arrays())}
+
+    def postings(self, grams):
+        """Word positions for each of grams, or None for a gram no word contains"""
+        return [self.words[g] if g >= 0 else None for g in _find(self.keys, sorted(grams)).tolist()]
+
+
+def _union(postings):
+    if not postings:
+        return _EMPTY
+    if len(postings) == 1:
+        return postings[0]
+    return np.unique(np.concatenate(postings))
+
+
+def _intersect(a, b):
+    return np.intersect1d(a, b, assume_unique=True)
+
+
+class WordIndex:
+    """
+    Word -> system ids postings plus a trigram index over the vocabulary.
+    Tokens are alphanumeric, so a token occurs in a document exactly when it occurs
+    inside one of the document's words; matching only ever scans the vocabulary.
+    """
+
+    VERIFY_THRESHOLD = 256
+
+    def __init__(self, documents):
+        words = defaultdict(set)
+        for i, text in enumerate(documents):
+            for word in tokenize(text):
+                words[word].add(i)
+
+        vocab = sorted(words)
+        self.vocab = _strings(vocab)
+        self.postings = PackedLists([_sorted_ids(words[w]) for w in vocab])
+        self._grams = GramIndex(vocab, trigrams)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index.vocab = arrays['vocab']
+        index.postings = PackedLists.from_arrays(_unprefixed('postings', arrays))
+        index._grams = GramIndex.from_arrays(_unprefixed('grams', arrays))
+        return index
+
+    def arrays(self):
+        return {
+            'vocab': self.vocab,
+            **_prefixed('postings', self.postings.arrays()),
+            **_prefixed('grams', self._grams.arrays()),
+        }
+
+    def words_with_prefix(self, prefix):
+        """Vocabulary positions [lo, hi) of words starting with prefix"""
+        lo, hi = np.searchsorted(self.vocab, [prefix, prefix + '\uffff'])
+        return int(lo), int(hi)
+
+    def position(self, word):
+        """Vocabulary position of word, or None"""
+        w = int(_find(self.vocab, [word])[0])
+        return w if w >= 0 else None
+
+    def words_containing(self, token):
+        """Vocabulary positions of words containing token (len(token) >= 3)"""
+        postings = self._grams.postings(trigrams(token))
+        if any(ws is None for ws in postings):
+            return []
+
+        # Intersect from the rarest trigram; once few words remain, checking them directly is cheaper
+        postings.sort(key=len)
+        candidates = postings[0]
+        for ws in postings[1:]:
+            if len(candidates) <= self.VERIFY_THRESHOLD:
+                break
+            candidates = _intersect(candidates, ws)
+        return candidates[np.char.find(self.vocab[candidates], token) >= 0].tolist()
+
+    def prefix(self, token):
+        lo, hi = self.words_with_prefix(token)
+        return _union(self.postings[lo:hi])
+
+    def contains(self, token):
+        postings = self.postings
+        return _union([postings[w] for w in self.words_containing(token)])
+
+    def match(self, token):
+        """Ids of documents containing token (prefix match for tokens shorter than a trigram)"""
+        if len(token) < 3:
+            return self.prefix(token)
+        return self.contains(token)
+
+
+class FuzzyIndex:
+    """
+    Padded-trigram index over words for typo-tolerant lookup.
+    Each edit touches at most three of the token's padded trigrams, so a word within k edits still
+    has at least (distinct padded trigrams of the token) - 3k of them; only words passing that
+    count (and the length bound) are checked with Levenshtein.
+    """
+
+    def __init__(self, words):
+        words = sorted(set(words))
+        self.words = _strings(words)
+        self._lengths = np.array([len(w) for w in words], dtype=np.int32)
+        self._grams = GramIndex(words, padded_trigrams)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index.words, index._lengths = arrays['words'], arrays['lengths']
+        index._grams = GramIndex.from_arrays(_unprefixed('grams', arrays))
+        return index
+
+    def arrays(self):
+        return {'words': self.words, 'lengths': self._lengths, **_prefixed('grams', self._grams.arrays())}
+
+    def similar(self, token, max_distance):
+        """(distance, word) pairs within max_distance edits of token, closest first"""
+        grams = padded_trigrams(token)
+        postings = [ws for ws in self._grams.postings(grams) if ws is not None]
+        if not postings:
+            return []
+
+        # Counted over distinct trigrams, since postings are per word and not per occurrence
+        min_shared = max(len(grams) - 3 * max_distance, 1)
+        ws, shared = np.unique(np.concatenate(postings), return_counts=True)
+        keep = (shared >= min_shared) & (np.abs(self._lengths[ws] - len(token)) <= max_distance)
+
+        matches = []
+        for word in self.words[ws[keep]].tolist():
+            distance = bounded_levenshtein(token, word, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, word))
+        matches.sort()
+        return matches
+
+
+class SearchIndex:
+    """Answers substring, prefix and multi-token queries without scanning every system"""
+
+    CACHE_SIZE = 1024
+
+    def __init__(self, pwsids, names, addresses, cities, counties, place_names=()):
+        keys = [str(p).upper() for p in pwsids]
+        self._pwsid_order = np.argsort(np.array(keys, dtype=object), kind='stable').astype(np.int32)
+        self._sorted_pwsids = _strings(keys[i] for i in self._pwsid_order)
+
+        names = [str(n).lower() for n in names]
+        self._name_order = np.argsort(np.array(names, dtype=object), kind='stable').astype(np.int32)
+        self._sorted_names = _strings(names[i] for i in self._name_order)
+
+        self._names = WordIndex(names)
+        self._all_fields = WordIndex(
+            ' '.join(str(field) for field in fields)
+            for fields in zip(names, addresses, cities, counties, pwsids)
+        )
+        # Known place names help correct town queries even when no system word is spelled that way
+        place_words = [w for place in place_names for w in tokenize(place)]
+        self._fuzzy = FuzzyIndex(self._all_fields.vocab.tolist() + place_words)
+
+        self._cache = LRUCache(self.CACHE_SIZE)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Index over arrays saved from arrays() (e.g. memory-mapped from a snapshot), used without copying"""
+        index = cls.__new__(cls)
+        index._pwsid_order, index._sorted_pwsids = arrays['pwsid_order'], arrays['sorted_pwsids']
+        index._name_order, index._sorted_names = arrays['name_order'], arrays['sorted_names']
+        index._names = WordIndex.from_arrays(_unprefixed('names', arrays))
+        index._all_fields = WordIndex.from_arrays(_unprefixed('all_fields', arrays))
+        index._fuzzy = FuzzyIndex.from_arrays(_unprefixed('fuzzy', arrays))
+        index._cache = LRUCache(cls.CACHE_SIZE)
+        return index
+
+    def arrays(self):
+        """{name: array} holding the whole index, for from_arrays()"""
+        return {
+            'pwsid_order': self._pwsid_order,
+            'sorted_pwsids': self._sorted_pwsids,
+            'name_order': self._name_order,
+            'sorted_names': self._sorted_names,
+            **_prefixed('names', self._names.arrays()),
+            **_prefixed('all_fields', self._all_fields.arrays()),
+            **_prefixed('fuzzy', self._fuzzy.arrays()),
+        }
+
+    @property
+    def size(self):
+        return len(self._pwsid_order)
+
+    def _names_with_prefix(self, prefix):
+        lo, hi = np.searchsorted(self._sorted_names, [prefix, prefix + '\uffff'])
+        return self._name_order[lo:hi]
+
+    def _match_all(self, index, tokens):
+        result = None
+        for token in tokens:
+            ids = index.match(token)
+            result = ids if result is None else _intersect(result, ids)
+            if not len(result):
+                break
+        return _EMPTY if result is None else result
+
+    def rank(self, ids, query, tokens):
+        """Order ids: exact PWSID, then name prefix, then all tokens in the name, then other fields"""
+        tiers = np.full(len(ids), RANK_OTHER_FIELD, dtype=np.int8)
+        tiers[np.isin(ids, self._match_all(self._names, tokens), assume_unique=True)] = RANK_NAME_MATCH
+        tiers[np.isin(ids, self._names_with_prefix(query.strip().lower()))] = RANK_NAME_PREFIX
+
+        exact = int(_find(self._sorted_pwsids, [query.strip().upper()])[0])
+        if exact >= 0:
+            tiers[ids == self._pwsid_order[exact]] = RANK_PWSID
+
+        # Stable within a tier so ties keep dataset order
+        return ids[np.lexsort((ids, tiers))]
+
+    def search(self, query):
+        """Ranked ids of systems matching every token of query; all systems if the query is empty"""
+        tokens = tokenize(query)
+        if not tokens:
+            return np.arange(self.size, dtype=np.int32)
+
+        # Type-ahead repeats the same prefixes, so keep recent results
+        def build():
+            result = self.rank(self._match_all(self._all_fields, tokens), query, tokens)
+            result.flags.writeable = False
+            return result
+
+        return self._cache.get_or_build(query.strip().lower(), build)
+
+    def fuzzy_search(self, query):
+        """
+        Ranked ids of systems matching every token of query within a few typos
+        Returns: (ids, corrections) where corrections maps misspelled tokens to the closest known word
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return np.arange(self.size, dtype=np.int32), {}
+
+        total_distance = np.zeros(self.size, dtype=np.int16)
+        matched = np.ones(self.size, dtype=bool)
+        corrections = {}
+
+        for token in tokens:
+            distance = np.full(self.size, np.iinfo(np.int16).max, dtype=np.int16)
+            # Exact (substring/prefix) hits always count as distance 0
+            distance[self._all_fields.match(token)] = 0
+
+            similar = self._fuzzy.similar(token, max_edits(token))
+            for d, word in similar:
+                w = self._all_fields.position(word)
+                if w is not None:
+                    ids = self._all_fields.postings[w]
+                    distance[ids] = np.minimum(distance[ids], d)
+
+            if similar and similar[0][1] != token and not (distance == 0).any():
+                corrections[token] = similar[0][1]
+
+            hit = distance < np.iinfo(np.int16).max
+            matched &= hit
+            total_distance[hit] += distance[hit]
+
+        ids = np.flatnonzero(matched).astype(np.int32)
+        if not len(ids):
+            return ids, corrections
+
+        # Closest spelling first, then the usual relevance tiers on the corrected query
+        corrected = [corrections.get(t, t) for t in tokens]
+        ranked = self.rank(ids, ' '.join(corrected), corrected)
+        order = np.argsort(total_distance[ranked], kind='stable')
+        return ranked[order], corrections
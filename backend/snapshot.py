@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Columnar Dataset Snapshot
+Typed, memory-mappable copy of polished_data.csv: one .npy file per column plus a JSON manifest.
+Low-cardinality text columns are stored as small-int codes, other text as int32 codes into a sorted
+table of distinct UTF-8 values, so readers can keep text undecoded in the shared mapping.
+
+Layout:
+    polished_snapshot/
+        CURRENT              name of the live version directory
+        v-<version>/
+            manifest.json
+            <column>.npy
+            <column>.table.npy   distinct values of a coded text column
+            <array>.npy          extra arrays that are not one value per row, e.g. partitions and saved indexes
+
+Usage: python snapshot.py           (convert the existing polished_data.csv)
+       python snapshot.py --watch   (keep publishing snapshots as the CSV changes, for DATASET_SHARED=1 workers)
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 3
+# Versions this code reads; version 1 stored free text as fixed-width bytes per row,
+# version 2 had no index arrays
+READABLE_FORMATS = (1, 2, 3)
+SNAPSHOT_DIRNAME = 'polished_snapshot'
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+
+# Text columns encoded as category codes
+CATEGORICAL_COLUMNS = ('type', 'owner_type', 'primary_source', 'risk_level', 'marker_color', 'activity_status')
+
+
+def snapshot_root(csv_path):
+    """Snapshot directory that accompanies a polished CSV"""
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), SNAPSHOT_DIRNAME)
+
+
+def _encode_column(name, series):
+    """Return (array, manifest entry) for one column"""
+    if series.dtype == bool:
+        return series.to_numpy(), {"kind": "bool"}
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(), {"kind": "numeric"}
+
+    if name in CATEGORICAL_COLUMNS:
+        categorical = pd.Categorical(series)
+        codes = categorical.codes.astype(np.int8 if len(categorical.categories) < 127 else np.int16)
+        return codes, {"kind": "category", "categories": [str(c) for c in categorical.categories]}
+
+    # Missing text is stored as an empty string, matching how the CSV reads back
+    encoded = [str(v).encode('utf-8') if isinstance(v, str) else b'' for v in series]
+    values = np.array(encoded, dtype=f"S{max(max(map(len, encoded), default=1), 1)}")
+    table, codes = np.unique(values, return_inverse=True)
+    return codes.ravel().astype(np.int32), {"kind": "coded", "table": table}
+
+
+class TextColumn:
+    """
+    Text column held as integer codes into a table of distinct values. Indexing with positions decodes
+    just those rows (missing values as NaN); slicing returns another undecoded view, like a NumPy slice.
+    """
+
+    dtype = np.dtype(object)
+
+    def __init__(self, codes, table):
+        self.codes = codes
+        self.table = table
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            return TextColumn(self.codes[rows], self.table)
+        raw = self.table[self.codes[rows]]
+        if np.ndim(raw) == 0:
+            return raw.decode('utf-8') if raw else np.nan
+        # tolist() yields bytes with trailing padding already stripped; far faster than np.char.decode
+        return np.array([b.decode('utf-8') if b else np.nan for b in raw.tolist()], dtype=object)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[np.arange(len(self))]
+        return values if dtype is None else values.astype(dtype)
+
+    def equals(self, value):
+        """Boolean mask of the rows equal to value, compared without decoding"""
+        return self.table[self.codes] == str(value).encode('utf-8')
+
+    def searchsorted(self, value, side='left', sorter=None):
+        """Insertion point of value in a column whose rows are in value order (as np.searchsorted)"""
+        # With a sorted table, codes rise with the values, so the search runs over the codes
+        bound = int(np.searchsorted(self.table, str(value).encode('utf-8'), side=side))
+        return np.searchsorted(self.codes, bound, side='left')
+
+
+def write_snapshot(df: pd.DataFrame, root, source_fingerprint=None, keep=2, arrays=None, metadata=None):
+    """
+    Write df as a new snapshot version and make it current, along with any extra named arrays
+    (e.g. row ids of a partition) and JSON metadata.
+    The version directory is fully written before CURRENT is switched, so readers never see a partial snapshot.
+    Returns: path of the new version directory
+    """
+    os.makedirs(root, exist_ok=True)
+    name = f"v-{time.time_ns():x}"
+    final_dir = os.path.join(root, name)
+    tmp_dir = final_dir + '.tmp'
+    os.makedirs(tmp_dir)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "rows": len(df),
+        "source_fingerprint": list(source_fingerprint) if source_fingerprint else None,
+        "columns": {},
+        "arrays": {},
+        "metadata": metadata or {},
+    }
+    for column in df.columns:
+        array, entry = _encode_column(column, df[column])
+        table = entry.pop("table", None)
+        if table is not None:
+            np.save(os.path.join(tmp_dir, f"{column}.table.npy"), table, allow_pickle=False)
+        np.save(os.path.join(tmp_dir, f"{column}.npy"), array, allow_pickle=False)
+        entry["dtype"] = array.dtype.str
+        manifest["columns"][column] = entry
+    for array_name, array in (arrays or {}).items():
+        array = np.asarray(array)
+        np.save(os.path.join(tmp_dir, f"{array_name}.npy"), array, allow_pickle=False)
+        manifest["arrays"][array_name] = {"dtype": array.dtype.str}
+
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_dir, final_dir)
+
+    pointer_tmp = os.path.join(root, CURRENT_FILE + '.tmp')
+    with open(pointer_tmp, 'w') as f:
+        f.write(name)
+    os.replace(pointer_tmp, os.path.join(root, CURRENT_FILE))
+
+    _remove_old_versions(root, keep)
+    return final_dir
+
+
+def _remove_old_versions(root, keep):
+    """Delete all but the newest `keep` versions (open memory maps stay valid after unlink)"""
+    versions = sorted(d for d in os.listdir(root) if d.startswith('v-') and not d.endswith('.tmp'))
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+
+def current_version_dir(root):
+    """Path of the live snapshot version, or None if there is no snapshot"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(root, name)
+    return path if os.path.isdir(path) else None
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def is_outdated(directory):
+    """True if there is no snapshot version or it was written in an older format"""
+    return directory is None or read_manifest(directory).get("format_version") != FORMAT_VERSION
+
+
+class Snapshot:
+    """Read-only view of one snapshot version; arrays are memory-mapped, not copied"""
+
+    def __init__(self, directory, mmap_mode='r'):
+        self.directory = directory
+        self.manifest = read_manifest(directory)
+        if self.manifest.get("format_version") not in READABLE_FORMATS:
+            raise ValueError(f"Unsupported snapshot format in {directory}")
+
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+
+        self.raw = {column: load(column) for column in self.manifest["columns"]}
+        self.tables = {
+            column: load(f"{column}.table")
+            for column, entry in self.manifest["columns"].items() if entry["kind"] == "coded"
+        }
+        self.arrays = {name: load(name) for name in self.manifest.get("arrays", {})}
+        self.metadata = self.manifest.get("metadata", {})
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    @property
+    def source_fingerprint(self):
+        fingerprint = self.manifest.get("source_fingerprint")
+        return tuple(fingerprint) if fingerprint else None
+
+    def shared_column(self, name):
+        """
+        Column without decoding: numbers and booleans as the memory-mapped array itself, text as a
+        TextColumn over the mapped codes, so processes attached to one version share the pages
+        """
+        entry = self.manifest["columns"][name]
+        raw = self.raw[name]
+        if entry["kind"] in ("numeric", "bool"):
+            return raw
+        if entry["kind"] == "coded":
+            return TextColumn(raw, self.tables[name])
+        if entry["kind"] == "category":
+            # Code -1 (missing) indexes the empty string appended to the table
+            table = np.array([c.encode('utf-8') for c in entry["categories"]] + [b''])
+            return TextColumn(raw, table)
+        # Version 1 text: every row is its own table entry
+        return TextColumn(np.arange(len(raw), dtype=np.int32), raw)
+
+    def column(self, name, rows=None):
+        """Decoded column (or just rows of it): numbers and booleans as stored, text as objects with NaN for missing"""
+        column = self.shared_column(name)
+        if rows is None:
+            rows = slice(None)
+        if isinstance(column, TextColumn) and isinstance(rows, slice):
+            rows = np.arange(len(column))[rows]
+        return column[rows]
+
+    def to_frame(self, columns=None):
+        return pd.DataFrame({name: self.column(name) for name in (columns or self.manifest["columns"])})
+
+
+def open_snapshot(root, mmap_mode='r'):
+    """Open the current snapshot under root, or return None if there is none"""
+    directory = current_version_dir(root)
+    return Snapshot(directory, mmap_mode=mmap_mode) if directory else None
+
+
+def snapshot_csv(csv_path):
+    """Write a snapshot of a polished CSV, tagged with the CSV's fingerprint. Returns: version directory"""
+    from data_store import dataset_fingerprint, read_polished_csv, write_store_snapshot
+
+    # Fingerprint before reading so a concurrent rewrite is never mistaken for this content
+    fingerprint = dataset_fingerprint(csv_path)
+    return write_store_snapshot(read_polished_csv(csv_path), snapshot_root(csv_path), source_fingerprint=fingerprint)
+
+
+def watch(csv_path, interval=2.0):
+    """Publish a snapshot whenever the CSV changes and has stayed unchanged for one poll"""
+    from data_store import dataset_fingerprint
+
+    root = snapshot_root(csv_path)
+    pending = None
+    while True:
+        directory = current_version_dir(root)
+        # An older format is republished as if the CSV had changed
+        published = read_manifest(directory).get("source_fingerprint") if not is_outdated(directory) else None
+        try:
+            fingerprint = dataset_fingerprint(csv_path)
+        except OSError:
+            fingerprint = None
+
+        if fingerprint is None or list(fingerprint) == published:
+            pending = None
+        elif fingerprint != pending:
+            pending = fingerprint
+        else:
+            pending = None
+            try:
+                print(f"✅ Published {snapshot_csv(csv_path)}")
+            except Exception as e:
+                print(f"❌ Error publishing snapshot: {e}")
+        time.sleep(interval)
+
+
+def main():
+    """Convert the existing polished_data.csv into a snapshot"""
+    from data_store import POLISHED_PATH
+
+    if not os.path.exists(POLISHED_PATH):
+        print("❌ polished_data.csv not found. Please run preprocess_data.py first.")
+        sys.exit(1)
+
+    directory = snapshot_csv(POLISHED_PATH)
+    print(f"✅ Wrote snapshot to {directory}")
+
+    if '--watch' in sys.argv[1:]:
+        print(f"👀 Watching {POLISHED_PATH} for changes...")
+        watch(POLISHED_PATH, interval=float(os.getenv('DATASET_RELOAD_INTERVAL', '2')))
+
+
+if __name__ == "__main__":
+    main()
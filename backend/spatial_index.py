@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Water System Spatial Index
+Uniform lat/lng grid for viewport queries, zoom-aware server-side clustering,
+and a KD-tree for nearest-system queries by great-circle distance.
+Both indexes are held as flat arrays, so a built index can be saved with a dataset snapshot
+and served from the memory-mapped files as is.
+"""
+
+import math
+
+import numpy as np
+
+from risk import RISK_COLORS, RISK_LEVELS
+
+# Below this zoom level points in view are merged into clusters
+CLUSTER_MAX_ZOOM = 11
+# Cluster cells per 256px map tile at the requested zoom (~64px cells)
+CLUSTER_CELLS_PER_TILE = 4
+MAX_ZOOM = 22
+
+
+def parse_bbox(value):
+    """Parse 'minLng,minLat,maxLng,maxLat' into floats"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be minLng,minLat,maxLng,maxLat")
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed maximums")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("zoom must be an integer")
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+def parse_point(lat, lng):
+    """Parse lat/lng query values into floats"""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("lat and lng are required numbers")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat must be within [-90, 90] and lng within [-180, 180]")
+    return lat, lng
+
+
+def parse_radius(value):
+    """Optional search radius in km"""
+    if value is None:
+        return None
+    try:
+        radius = float(value)
+    except ValueError:
+        raise ValueError("radius_km must be a number")
+    if not radius > 0:
+        raise ValueError("radius_km must be positive")
+    return radius
+
+
+def cluster_cell_degrees(zoom):
+    """Width of a clustering cell in degrees of longitude at this zoom"""
+    return 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+
+class GridIndex:
+    """
+    Points bucketed into fixed-size cells. Each grid row is a contiguous run of cell keys,
+    so a bounding box query is one binary search per row plus an exact filter on the hits.
+    """
+
+    def __init__(self, lats, lngs, cell_size=0.1):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.cell_size = cell_size
+
+        if len(self.lats):
+            self.min_lat, self.min_lng = float(self.lats.min()), float(self.lngs.min())
+            self.rows = int((self.lats.max() - self.min_lat) // cell_size) + 1
+            self.cols = int((self.lngs.max() - self.min_lng) // cell_size) + 1
+        else:
+            self.min_lat = self.min_lng = 0.0
+            self.rows = self.cols = 0
+
+        keys = self._row(self.lats) * self.cols + self._col(self.lngs)
+        self._order = np.argsort(keys, kind='stable').astype(np.int32)
+        self._keys = keys[self._order]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Index over arrays saved from arrays() (e.g. memory-mapped from a snapshot), used without copying"""
+        index = cls.__new__(cls)
+        index.lats, index.lngs = arrays['lats'], arrays['lngs']
+        index._order, index._keys = arrays['order'], arrays['keys']
+        index.min_lat, index.min_lng, index.cell_size = (float(v) for v in arrays['origin'])
+        index.rows, index.cols = (int(v) for v in arrays['shape'])
+        return index
+
+    def arrays(self):
+        """{name: array} holding the whole index, for from_arrays()"""
+        return {
+            'lats': self.lats,
+            'lngs': self.lngs,
+            'order': self._order,
+            'keys': self._keys,
+            'origin': np.array([self.min_lat, self.min_lng, self.cell_size]),
+            'shape': np.array([self.rows, self.cols], dtype=np.int64),
+        }
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _row(self, lat):
+        return np.floor((lat - self.min_lat) / self.cell_size).astype(np.int64)
+
+    def _col(self, lng):
+        return np.floor((lng - self.min_lng) / self.cell_size).astype(np.int64)
+
+    def query_bbox(self, min_lng, min_lat, max_lng, max_lat):
+        """Sorted ids of points inside the bounding box"""
+        if not len(self):
+            return self._order
+
+        r0 = max(int(self._row(min_lat)), 0)
+        r1 = min(int(self._row(max_lat)), self.rows - 1)
+        c0 = max(int(self._col(min_lng)), 0)
+        c1 = min(int(self._col(max_lng)), self.cols - 1)
+        if r0 > r1 or c0 > c1:
+            return np.empty(0, dtype=np.int32)
+
+        row_keys = np.arange(r0, r1 + 1, dtype=np.int64) * self.cols
+        starts = np.searchsorted(self._keys, row_keys + c0, side='left')
+        ends = np.searchsorted(self._keys, row_keys + c1, side='right')
+        candidates = np.concatenate([self._order[s:e] for s, e in zip(starts, ends)])
+
+        # Cells on the edge of the box are only partly inside it
+        lats, lngs = self.lats[candidates], self.lngs[candidates]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lngs >= min_lng) & (lngs <= max_lng)
+        return np.sort(candidates[inside])
+
+
+def cluster_points(ids, lats, lngs, risk_codes, zoom):
+    """
+    Merge points that fall in the same zoom-dependent cell
+    Returns: (clusters, singles) where singles are ids of points alone in their cell
+    """
+    if not len(ids):
+        return [], ids
+
+    cell = cluster_cell_degrees(zoom)
+    # Latitude cells shrink with the Mercator scale so clusters stay roughly square on screen
+    lat_cell = cell * math.cos(math.radians(float(np.mean(lats[ids]))))
+    cx = np.floor(lngs[ids] / cell).astype(np.int64)
+    cy = np.floor(lats[ids] / lat_cell).astype(np.int64)
+
+    _, inverse, counts = np.unique(np.stack([cx, cy], axis=1), axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    lat_sum = np.bincount(inverse, weights=lats[ids])
+    lng_sum = np.bincount(inverse, weights=lngs[ids])
+    worst = np.full(len(counts), len(RISK_LEVELS) - 1, dtype=np.int8)
+    np.minimum.at(worst, inverse, risk_codes[ids])
+
+    clusters = [
+        {
+            "lat": round(float(lat_sum[c] / counts[c]), 5),
+            "lng": round(float(lng_sum[c] / counts[c]), 5),
+            "count": int(counts[c]),
+            "risk_level": RISK_LEVELS[worst[c]],
+            "marker_color": RISK_COLORS[worst[c]]
+        }
+        for c in np.flatnonzero(counts > 1)
+    ]
+    singles = ids[counts[inverse] == 1]
+    return clusters, singles
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Points per KD-tree leaf; leaves are scanned with one vectorized distance computation
+LEAF_SIZE = 32
+
+# Points closer than this (about a metre) count as sharing a location when spreading them out
+COLOCATED_DEGREES = 1e-5
+# Distance between neighbouring points in a spread-out group
+SPREAD_SPACING_M = 120.0
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distances in km from (lat, lng) to each of lats/lngs"""
+    lat, lng = math.radians(lat), math.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _unit_vectors(lats, lngs):
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    return np.column_stack([np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)])
+
+
+class KDTree:
+    """
+    Nearest-neighbour index over points on the sphere. Points are stored as 3D unit vectors, where
+    straight-line (chord) distance orders points exactly as great-circle distance does, so pruning is
+    exact and there is no special case at the antimeridian or the poles.
+    """
+
+    # Per-node arrays; leaves have dim -1
+    NODE_ARRAYS = ('dim', 'split', 'left', 'right', 'start', 'end')
+
+    def __init__(self, lats, lngs, leaf_size=LEAF_SIZE):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        points = _unit_vectors(self.lats, self.lngs)
+
+        # Nodes as parallel lists while building; leaves own the range [start, end) of the permuted points
+        self._dim, self._split, self._left, self._right, self._start, self._end = [], [], [], [], [], []
+        order = np.arange(len(points))
+        if len(points):
+            self._build(points, order, 0, len(points), leaf_size)
+        self._order = order
+        self._points = points[order]
+
+        self._split = np.array(self._split, dtype=np.float64)
+        self._dim, self._left, self._right, self._start, self._end = (
+            np.array(values, dtype=np.int64)
+            for values in (self._dim, self._left, self._right, self._start, self._end)
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Tree over arrays saved from arrays() (e.g. memory-mapped from a snapshot), used without copying"""
+        tree = cls.__new__(cls)
+        tree.lats, tree.lngs = arrays['lats'], arrays['lngs']
+        tree._order, tree._points = arrays['order'], arrays['points']
+        for name in cls.NODE_ARRAYS:
+            setattr(tree, f'_{name}', arrays[name])
+        return tree
+
+    def arrays(self):
+        """{name: array} holding the whole tree, for from_arrays()"""
+        arrays = {'lats': self.lats, 'lngs': self.lngs, 'order': self._order, 'points': self._points}
+        arrays.update((name, getattr(self, f'_{name}')) for name in self.NODE_ARRAYS)
+        return arrays
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _add_node(self, dim, split, start, end):
+        for values, value in zip(
+            (self._dim, self._split, self._left, self._right, self._start, self._end),
+            (dim, split, -1, -1, start, end)
+        ):
+            values.append(value)
+        return len(self._dim) - 1
+
+    def _build(self, points, order, start, end, leaf_size):
+        if end - start <= leaf_size:
+            return self._add_node(-1, 0.0, start, end)
+
+        # Split the widest dimension at its median
+        block = points[order[start:end]]
+        dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+        middle = (end - start) // 2
+        partition = np.argpartition(block[:, dim], middle)
+        order[start:end] = order[start:end][partition]
+
+        node = self._add_node(dim, float(points[order[start + middle], dim]), start, end)
+        self._left[node] = self._build(points, order, start, start + middle, leaf_size)
+        self._right[node] = self._build(points, order, start + middle, end, leaf_size)
+        return node
+
+    def query(self, lat, lng, k=10, radius_km=None):
+        """
+        Up to k points nearest to (lat, lng), within radius_km if given
+        Returns: (ids, distances_km), nearest first
+        """
+        if not len(self) or k < 1:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        target = _unit_vectors(np.array([lat]), np.array([lng]))[0]
+        # Anything further than the radius (as a squared chord) is never a candidate
+        limit = np.inf
+        if radius_km is not None:
+            limit = (2 * math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2)) ** 2
+
+        best_ids = np.empty(0, dtype=np.int64)
+        best_d2 = np.empty(0)
+        bound = limit
+        stack = [(0, 0.0)]
+        while stack:
+            node, gap = stack.pop()
+            if gap > bound:
+                continue
+
+            dim = int(self._dim[node])
+            if dim < 0:
+                start, end = int(self._start[node]), int(self._end[node])
+                d2 = ((self._points[start:end] - target) ** 2).sum(axis=1)
+                keep = d2 <= bound
+                best_ids = np.concatenate([best_ids, np.arange(start, end)[keep]])
+                best_d2 = np.concatenate([best_d2, d2[keep]])
+                if len(best_d2) > k:
+                    nearest = np.argpartition(best_d2, k - 1)[:k]
+                    best_ids, best_d2 = best_ids[nearest], best_d2[nearest]
+                if len(best_d2) == k:
+                    bound = min(limit, float(best_d2.max()))
+                continue
+
+            diff = float(target[dim] - self._split[node])
+            left, right = int(self._left[node]), int(self._right[node])
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Far side first so the near side is popped (and tightens the bound) first
+            stack.append((far, max(gap, diff * diff)))
+            stack.append((near, gap))
+
+        ids = self._order[best_ids]
+        distances = haversine_km(lat, lng, self.lats[ids], self.lngs[ids])
+        ranked = np.lexsort((ids, distances))
+        return ids[ranked], distances[ranked]
+
+
+def spread_colocated(lats, lngs, order, spacing_m=SPREAD_SPACING_M):
+    """
+    Display positions for points that share a location: points are grouped by their COLOCATED_DEGREES
+    grid cell (by sorting the cells, O(n log n)) and each group is laid out on a sunflower spiral around
+    its original point, spacing_m apart, in the order given by order (a sort key per point) so the
+    layout is deterministic. Missing (NaN) and lone points keep their position.
+    Returns: (lats, lngs, group sizes)
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    display_lats, display_lngs = lats.copy(), lngs.copy()
+    sizes = np.ones(len(lats), dtype=np.int64)
+
+    located = np.flatnonzero(~(np.isnan(lats) | np.isnan(lngs)))
+    if not len(located):
+        return display_lats, display_lngs, sizes
+
+    cells = np.stack([
+        np.floor(lats[located] / COLOCATED_DEGREES).astype(np.int64),
+        np.floor(lngs[located] / COLOCATED_DEGREES).astype(np.int64),
+    ], axis=1)
+    _, group, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    group = group.ravel()
+
+    # Rank of each point within its group, by group then the caller's order
+    ranked = np.lexsort((np.asarray(order)[located], group))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(len(located), dtype=np.int64)
+    rank[ranked] = np.arange(len(located)) - starts[group[ranked]]
+
+    shared = counts[group] > 1
+    points, rank = located[shared], rank[shared]
+    radius = spacing_m / 1000.0 / EARTH_RADIUS_KM * np.sqrt(rank + 0.5)
+    angle = rank * GOLDEN_ANGLE
+    # Spread around the group's first point so every member moves by the same rule
+    first = ranked[starts]
+    centre_lats = lats[located][first][group[shared]]
+    centre_lngs = lngs[located][first][group[shared]]
+    display_lats[points] = centre_lats + np.degrees(radius * np.cos(angle))
+    display_lngs[points] = centre_lngs + np.degrees(radius * np.sin(angle)) / np.cos(np.radians(centre_lats))
+    sizes[located] = counts[group]
+    return display_lats, display_lngs, sizes
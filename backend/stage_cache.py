@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Preprocessing Stage Cache
+Content-hash fingerprints of the inputs, cached stage outputs keyed by everything upstream of them,
+and per-PWSID row diffs so row-wise stages only recompute systems whose inputs changed
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def digest(*parts):
+    """Short stable hash of repr()-able parts"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def row_hashes(frame, columns):
+    """One content hash per row over columns"""
+    return pd.util.hash_pandas_object(frame[list(columns)], index=False).to_numpy()
+
+
+class StageCache:
+    """Pickled stage outputs in cache_dir; a key changes whenever any input upstream of the stage changes"""
+
+    HASHES_FILE = 'file_hashes.json'
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._hashes_path = os.path.join(cache_dir, self.HASHES_FILE)
+        try:
+            with open(self._hashes_path) as f:
+                self._hashes = json.load(f)
+        except (OSError, ValueError):
+            self._hashes = {}
+
+        # Stages whose cached output was reused in this run
+        self.hits = set()
+
+    def _write(self, path, write):
+        tmp_path = path + '.tmp'
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _save_hashes(self, path):
+        with open(path, 'w') as f:
+            json.dump(self._hashes, f, indent=2)
+
+    def file_digest(self, path):
+        """
+        Content hash of a file, or None if it does not exist. Hashes are remembered by
+        (mtime, size), so an untouched file is never re-read and a touched but identical one keeps its hash.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        known = self._hashes.get(os.path.abspath(path))
+        if known and known['stamp'] == stamp:
+            return known['sha1']
+
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        self._hashes[os.path.abspath(path)] = {'stamp': stamp, 'sha1': sha1.hexdigest()}
+        self._write(self._hashes_path, self._save_hashes)
+        return sha1.hexdigest()
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, f"stage-{name}-{key}.pkl")
+
+    def _prune(self, name, keep):
+        prefix = f"stage-{name}-"
+        for entry in os.listdir(self.cache_dir):
+            if entry.startswith(prefix) and entry != os.path.basename(keep):
+                os.remove(os.path.join(self.cache_dir, entry))
+
+    def get(self, name, key):
+        """Cached output of stage name for key, or None"""
+        path = self._path(name, key)
+        if not os.path.exists(path):
+            return None
+        self.hits.add(name)
+        return pd.read_pickle(path)
+
+    def put(self, name, key, result):
+        """Cache result as the output of stage name for key, replacing older keys"""
+        path = self._path(name, key)
+        self._write(path, lambda p: pd.to_pickle(result, p))
+        self._prune(name, path)
+
+    def stage(self, name, key, build):
+        """Cached output of build() for key; only the latest key per stage is kept"""
+        result = self.get(name, key)
+        if result is not None:
+            print(f"   ♻️  {name}: inputs unchanged, reusing cached output")
+            return result
+
+        result = build()
+        self.put(name, key, result)
+        return result
+
+    def rows(self, name, frame, id_column, input_columns, output_columns, compute, context=''):
+        """
+        Row-wise stage with a per-system diff: rows whose id and input values match the last run
+        reuse its outputs, and compute(changed_rows) -> DataFrame of output_columns runs on the rest.
+        context covers anything else the outputs depend on (e.g. lookup tables); changing it recomputes all rows.
+        """
+        path = os.path.join(self.cache_dir, f"rows-{name}.pkl")
+        hashes = row_hashes(frame, input_columns)
+
+        previous = None
+        if os.path.exists(path):
+            cached = pd.read_pickle(path)
+            if cached['context'] == context:
+                previous = cached['rows']
+
+        columns = list(output_columns)
+        outputs = pd.DataFrame(index=frame.index, columns=columns, dtype=object)
+        changed = np.ones(len(frame), dtype=bool)
+        if previous is not None:
+            keys = pd.DataFrame({id_column: frame[id_column].to_numpy(), '_hash': hashes})
+            keys['_position'] = np.arange(len(keys))
+            matched = keys.merge(previous.drop_duplicates([id_column, '_hash']), on=[id_column, '_hash'])
+            positions = matched['_position'].to_numpy()
+            outputs.iloc[positions] = matched[columns].to_numpy()
+            changed[positions] = False
+
+        if changed.any():
+            outputs.iloc[np.flatnonzero(changed)] = compute(frame.iloc[np.flatnonzero(changed)])[columns].to_numpy()
+        print(f"   ♻️  {name}: reused {int((~changed).sum())} systems, recomputed {int(changed.sum())}")
+
+        saved = outputs.copy()
+        saved[id_column] = frame[id_column].to_numpy()
+        saved['_hash'] = hashes
+        self._write(path, lambda p: pd.to_pickle({'context': context, 'rows': saved.reset_index(drop=True)}, p))
+        return outputs
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Statistics Engine
+Additive aggregates over the polished dataset, computed in one vectorized pass per load
+and updated from only the changed rows when the dataset is reloaded
+"""
+
+import numpy as np
+import pandas as pd
+
+# Additive per-row metrics; everything served is derived from sums of these
+METRICS = (
+    'systems',
+    'population',
+    'current_violations',
+    'total_violations',
+    'health_violations',
+    'archived_violations',
+    'with_current_violations',
+    'compliant',
+    'with_archived_violations',
+)
+_M = {name: i for i, name in enumerate(METRICS)}
+
+# Columns that statistics are broken down by
+DIMENSIONS = ('type', 'risk_level', 'owner_type', 'primary_source', 'county')
+
+TOTAL = '_total'
+
+# Metrics accepted by the aggregate API, mapped to the column they sum (count has none)
+AGGREGATE_METRICS = {
+    'count': None,
+    'population': 'population',
+    'total_violations': 'total_violations',
+    'health_violations': 'health_violations',
+    'unaddressed_violations': 'unaddressed_violations',
+    'archived_violations': 'archived_violations',
+}
+
+
+def _labels(values):
+    """Group labels with missing values collected under 'Unknown'"""
+    labels = pd.Series(np.asarray(values, dtype=object), dtype=object).fillna('').astype(str)
+    return labels.where(labels != '', 'Unknown').to_numpy()
+
+
+def encode_groups(columns):
+    """Integer codes per dimension: {dimension: (labels, codes)} for grouping without strings"""
+    groups = {}
+    for dimension in DIMENSIONS:
+        labels, codes = np.unique(_labels(columns[dimension]), return_inverse=True)
+        groups[dimension] = (labels, codes.ravel().astype(np.int64))
+    return groups
+
+
+def group_aggregate(groups, columns, ids, group_by, metrics):
+    """
+    Group the selected rows by one or more dimensions and compute metrics per group
+    Returns: list of {dimension: label, ..., metric: value, ...}, largest groups first
+    """
+    if not len(ids):
+        return []
+
+    # Combine the per-dimension codes into one mixed-radix key per row
+    key = np.zeros(len(ids), dtype=np.int64)
+    for dimension in group_by:
+        labels, codes = groups[dimension]
+        key = key * len(labels) + codes[ids]
+    keys, inverse = np.unique(key, return_inverse=True)
+    inverse = inverse.ravel()
+
+    counts = np.bincount(inverse, minlength=len(keys))
+    values = {}
+    for metric in metrics:
+        column = AGGREGATE_METRICS[metric]
+        if column is None:
+            values[metric] = counts
+        else:
+            values[metric] = np.bincount(inverse, weights=columns[column][ids], minlength=len(keys)).astype(np.int64)
+
+    # Decode keys back to labels, last dimension first
+    labels_by_dimension = {}
+    remaining = keys.copy()
+    for dimension in reversed(group_by):
+        labels, _ = groups[dimension]
+        remaining, code = np.divmod(remaining, len(labels))
+        labels_by_dimension[dimension] = labels[code]
+
+    rows = []
+    for g in np.argsort(-counts, kind='stable'):
+        row = {dimension: str(labels_by_dimension[dimension][g]) for dimension in group_by}
+        row.update((metric, int(values[metric][g])) for metric in metrics)
+        rows.append(row)
+    return rows
+
+
+def metric_matrix(columns, rows):
+    """Per-row metric contributions for the selected rows (rows x METRICS)"""
+    unaddressed = columns['unaddressed_violations'][rows]
+    archived = columns['archived_violations'][rows]
+    return np.column_stack([
+        np.ones(len(rows), dtype=np.int64),
+        columns['population'][rows],
+        unaddressed,
+        columns['total_violations'][rows],
+        columns['health_violations'][rows],
+        archived,
+        unaddressed > 0,
+        unaddressed == 0,
+        archived > 0,
+    ]).astype(np.int64)
+
+
+def aggregate(columns, rows):
+    """
+    Sum metrics for rows, split by activity and each dimension
+    Returns: {(scope, dimension, label): metric vector}
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    matrix = metric_matrix(columns, rows)
+    is_active = columns['is_active'][rows]
+
+    sums = {}
+    for scope, selected in (('active', is_active), ('inactive', ~is_active)):
+        part = matrix[selected]
+        sums[(scope, TOTAL, TOTAL)] = part.sum(axis=0)
+        if not len(part):
+            continue
+
+        for dimension in DIMENSIONS:
+            labels, inverse = np.unique(_labels(columns[dimension][rows[selected]]), return_inverse=True)
+            grouped = np.zeros((len(labels), len(METRICS)), dtype=np.int64)
+            np.add.at(grouped, inverse.ravel(), part)
+            for label, vector in zip(labels, grouped):
+                sums[(scope, dimension, str(label))] = vector
+    return sums
+
+
+def _combine(target, sums, sign):
+    for key, vector in sums.items():
+        current = target.get(key)
+        target[key] = vector * sign if current is None else current + sign * vector
+
+
+class SystemStats:
+    """Aggregates for one dataset version plus the payloads the stats endpoints serve"""
+
+    def __init__(self, sums, row_hashes, changed_rows):
+        # Drop groups that no longer contain any system
+        self.sums = {k: v for k, v in sums.items() if k[1] == TOTAL or v[_M['systems']] > 0}
+        self.row_hashes = row_hashes
+        self.changed_rows = changed_rows
+
+        self.water_systems = self._water_system_stats()
+        self.comprehensive = self._comprehensive_stats()
+
+    @classmethod
+    def build(cls, columns, row_hashes, previous=None):
+        """
+        Aggregate every row, or, given the previous version's stats, only the rows whose
+        content hash changed: old versions are subtracted and new versions added
+        """
+        if previous is None:
+            rows = np.arange(len(row_hashes))
+            return cls(aggregate(columns, rows), row_hashes, len(rows))
+
+        old_stats, old_columns = previous
+        removed = np.flatnonzero(~np.isin(old_stats.row_hashes, row_hashes))
+        added = np.flatnonzero(~np.isin(row_hashes, old_stats.row_hashes))
+
+        sums = dict(old_stats.sums)
+        _combine(sums, aggregate(old_columns, removed), -1)
+        _combine(sums, aggregate(columns, added), 1)
+        return cls(sums, row_hashes, len(removed) + len(added))
+
+    def total(self, scope, metric):
+        vector = self.sums.get((scope, TOTAL, TOTAL))
+        return int(vector[_M[metric]]) if vector is not None else 0
+
+    def breakdown(self, scope, dimension, metric='systems'):
+        """{label: metric} for one dimension, largest first"""
+        values = {
+            label: int(vector[_M[metric]])
+            for (s, d, label), vector in self.sums.items()
+            if s == scope and d == dimension
+        }
+        return dict(sorted(values.items(), key=lambda item: (-item[1], item[0])))
+
+    def _water_system_stats(self):
+        """Active systems and current (unaddressed) violations only"""
+        total = self.total('active', 'systems')
+        population = self.total('active', 'population')
+        compliant = self.total('active', 'compliant')
+
+        return {
+            "total_systems": total,
+            "systems_by_type": self.breakdown('active', 'type'),
+            "systems_by_risk": self.breakdown('active', 'risk_level'),
+            "systems_by_owner_type": self.breakdown('active', 'owner_type'),
+            "systems_by_primary_source": self.breakdown('active', 'primary_source'),
+            "systems_by_county": self.breakdown('active', 'county'),
+            "population_by_type": self.breakdown('active', 'type', 'population'),
+            "population_by_county": self.breakdown('active', 'county', 'population'),
+            "population_served": population,
+            "avg_population_per_system": round(population / total) if total else 0,
+            "total_violations": self.total('active', 'current_violations'),  # Using current violations only
+            "systems_with_violations": self.total('active', 'with_current_violations'),  # Using current violations only
+            "compliance_rate": round(compliant / total * 100, 1) if total else 0,
+            "compliance_note": "Statistics based on active systems and current (unaddressed) violations only",
+            "data_source": "polished_sdwis_active_only"
+        }
+
+    def _comprehensive_stats(self):
+        """Statistics over active and inactive systems"""
+        active_count = self.total('active', 'systems')
+        compliant = self.total('active', 'compliant')
+        with_archived = self.total('active', 'with_archived_violations')
+
+        return {
+            "active_systems": {
+                "count": active_count,
+                "with_current_violations": self.total('active', 'with_current_violations'),
+                "with_archived_violations": with_archived,
+                "population_served": self.total('active', 'population')
+            },
+            "inactive_systems": {
+                "count": self.total('inactive', 'systems'),
+                "total_violations": self.total('inactive', 'total_violations'),
+                "archived_violations": self.total('inactive', 'archived_violations')
+            },
+            "compliance_summary": {
+                "total_active_systems": active_count,
+                "compliant_systems": compliant,
+                "compliance_rate": round((compliant / active_count) * 100, 1) if active_count > 0 else 0,
+                "systems_with_resolved_issues": with_archived
+            },
+            "data_source": "comprehensive_polished_data"
+        }
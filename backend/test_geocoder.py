@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Geocoder Tests
+AsyncGeocoder against a local stub server reached through GEOCODE_BASE_URL: retries, misses,
+the SQLite cache and its expiry
+"""
+
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from geocoder import CACHE_TTL, MISS_TTL, AsyncGeocoder, GeocodeCache
+
+MACON = (32.8407, -83.6324)
+
+# Stub answers per (normalized) address: a list of responses served in turn, the last one repeating
+ANSWERS = {
+    '1 MAIN ST, MACON, GA': [(200, 'OK')],
+    'NOWHERE, GA': [(200, 'ZERO_RESULTS')],
+    'FLAKY RD, MACON, GA': [(503, None), (200, 'OVER_QUERY_LIMIT'), (200, 'OK')],
+    'DOWN RD, MACON, GA': [(503, None)],
+    'DENIED RD, MACON, GA': [(200, 'REQUEST_DENIED')],
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        address = parse_qs(urlparse(self.path).query)['address'][0]
+        with self.server.lock:
+            seen = self.server.requests[address]
+            self.server.requests[address] += 1
+        answers = ANSWERS[address]
+        code, status = answers[min(seen, len(answers) - 1)]
+
+        body = {'status': status, 'results': []}
+        if status == 'OK':
+            body['results'] = [{'geometry': {'location': {'lat': MACON[0], 'lng': MACON[1]}}}]
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = Counter()
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    monkeypatch.setenv('GEOCODE_BASE_URL', f'http://127.0.0.1:{server.server_port}/geocode/json')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'geocode_cache.sqlite')
+
+
+def geocode(cache_path, addresses):
+    geocoder = AsyncGeocoder('test-key', cache_path, rate=1000, backoff=0)
+    try:
+        return geocoder.geocode_all(addresses), dict(geocoder.stats)
+    finally:
+        geocoder.close()
+
+
+def test_found_address(stub, cache_path):
+    results, stats = geocode(cache_path, ['1 Main St., Macon, GA'])
+    assert results == {'1 Main St., Macon, GA': MACON}
+    assert stats['requested'] == 1
+
+
+def test_retries_server_errors_and_retryable_statuses(stub, cache_path):
+    results, stats = geocode(cache_path, ['Flaky Rd, Macon, GA'])
+    assert results['Flaky Rd, Macon, GA'] == MACON
+    assert stub.requests['FLAKY RD, MACON, GA'] == 3
+    assert stats['retried'] == 2
+
+
+def test_gives_up_after_retries_without_caching(stub, cache_path):
+    results, stats = geocode(cache_path, ['Down Rd, Macon, GA'])
+    assert results['Down Rd, Macon, GA'] == (None, None)
+    assert stub.requests['DOWN RD, MACON, GA'] == 4
+    assert stats['failed'] == 1
+
+    # Failures are asked again on the next run
+    geocode(cache_path, ['Down Rd, Macon, GA'])
+    assert stub.requests['DOWN RD, MACON, GA'] == 8
+
+
+def test_request_denied_is_not_retried(stub, cache_path):
+    results, stats = geocode(cache_path, ['Denied Rd, Macon, GA'])
+    assert results['Denied Rd, Macon, GA'] == (None, None)
+    assert stub.requests['DENIED RD, MACON, GA'] == 1
+    assert stats['failed'] == 1
+
+
+def test_zero_results_is_a_cached_miss(stub, cache_path):
+    results, _ = geocode(cache_path, ['Nowhere, GA'])
+    assert results == {'Nowhere, GA': (None, None)}
+
+    results, stats = geocode(cache_path, ['Nowhere, GA'])
+    assert results == {'Nowhere, GA': (None, None)}
+    assert stub.requests['NOWHERE, GA'] == 1
+    assert stats['cached'] == 1
+
+
+def test_second_run_is_served_from_cache(stub, cache_path):
+    addresses = ['1 Main St., Macon, GA', '1 MAIN ST,  MACON,GA', 'Nowhere, GA']
+    geocode(cache_path, addresses)
+    results, stats = geocode(cache_path, addresses)
+    assert results['1 MAIN ST,  MACON,GA'] == MACON
+    assert stats == {'cached': 2, 'requested': 0, 'retried': 0, 'failed': 0}
+    assert sum(stub.requests.values()) == 2
+
+
+def age_cache(cache_path, seconds):
+    """Make every cached answer seconds older"""
+    cache = GeocodeCache(cache_path)
+    try:
+        cache._db.execute("UPDATE geocode SET fetched_at = fetched_at - ?", (seconds,))
+        cache._db.commit()
+    finally:
+        cache.close()
+
+
+def test_expired_misses_are_requested_again_before_hits(stub, cache_path):
+    addresses = ['1 Main St., Macon, GA', 'Nowhere, GA']
+    geocode(cache_path, addresses)
+
+    # Misses expire after MISS_TTL, found addresses only after CACHE_TTL
+    age_cache(cache_path, MISS_TTL + 60)
+    geocode(cache_path, addresses)
+    assert stub.requests == {'1 MAIN ST, MACON, GA': 1, 'NOWHERE, GA': 2}
+
+    age_cache(cache_path, CACHE_TTL + 60)
+    geocode(cache_path, addresses)
+    assert stub.requests == {'1 MAIN ST, MACON, GA': 2, 'NOWHERE, GA': 3}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Search Index Tests
+Fuzzy lookup must find every word within the edit bound, wherever the typo is
+"""
+
+import pytest
+
+from search_index import FuzzyIndex, SearchIndex, bounded_levenshtein, max_edits
+
+WORDS = ['macon', 'mason', 'cairo', 'rome', 'valdosta', 'dahlonega', 'banana', 'savannah', 'atlanta', 'lalala']
+
+
+def brute_force(words, token, max_distance):
+    matches = [(bounded_levenshtein(token, w, max_distance), w) for w in words]
+    return sorted(m for m in matches if m[0] <= max_distance)
+
+
+def substitutions(word):
+    return [word[:i] + 'x' + word[i + 1:] for i in range(len(word))]
+
+
+def transpositions(word):
+    return [word[:i] + word[i + 1] + word[i] + word[i + 2:] for i in range(len(word) - 1)]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return FuzzyIndex(WORDS)
+
+
+@pytest.mark.parametrize('word', WORDS)
+def test_single_substitution_anywhere(index, word):
+    for token in substitutions(word):
+        assert word in [w for _, w in index.similar(token, max_edits(token))], token
+
+
+@pytest.mark.parametrize('word', [w for w in WORDS if len(w) > 5])
+def test_transposition_anywhere(index, word):
+    # A transposition is two edits, which longer words tolerate
+    for token in transpositions(word):
+        assert word in [w for _, w in index.similar(token, max_edits(token))], token
+
+
+@pytest.mark.parametrize('token', ['maxon', 'caxro', 'rxme', 'vxldoxta', 'dahxonxga', 'bananx', 'lalxla', 'svaannah'])
+def test_matches_brute_force(index, token):
+    k = max_edits(token)
+    assert index.similar(token, k) == brute_force(WORDS, token, k)
+
+
+def test_index_from_saved_arrays_answers_alike():
+    names = [f'{w} water system' for w in WORDS]
+    pwsids = [f'GA{i:07d}' for i in range(len(WORDS))]
+    built = SearchIndex(pwsids, names, ['main st'] * len(WORDS), WORDS, ['bibb'] * len(WORDS))
+    saved = SearchIndex.from_arrays({name: array.copy() for name, array in built.arrays().items()})
+    for query in ['mac', 'water', 'GA0000003', 'savanah', 'dahlonga sys', 'zzz']:
+        assert saved.search(query).tolist() == built.search(query).tolist()
+        ids, corrections = built.fuzzy_search(query)
+        saved_ids, saved_corrections = saved.fuzzy_search(query)
+        assert saved_ids.tolist() == ids.tolist() and saved_corrections == corrections
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Map Tiles
+Pre-aggregated water system tiles on the Web Mercator z/x/y grid, built lazily and kept in an LRU cache
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+from lru_cache import LRUCache
+from response_cache import encode_json
+from spatial_index import CLUSTER_MAX_ZOOM, MAX_ZOOM, cluster_points
+
+# Fields a map marker needs; full records stay available from the list endpoints
+TILE_FIELDS = ('pwsid', 'name', 'type', 'population', 'lat', 'lng', 'risk_level', 'marker_color')
+
+
+def tile_bounds(z, x, y):
+    """Bounding box (minLng, minLat, maxLng, maxLat) of a slippy-map tile"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def validate_tile(z, x, y):
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f"Zoom must be between 0 and {MAX_ZOOM}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError("Tile coordinates out of range for this zoom")
+
+
+def build_tile(store, z, x, y):
+    """Encode the systems (or clusters of them) inside one tile as JSON bytes"""
+    index = store.spatial_index
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+    ids = index.query_bbox(min_lng, min_lat, max_lng, max_lat)
+
+    # Tiles share edges; the east and north edges belong to the neighbouring tile
+    edge = np.zeros(len(ids), dtype=bool)
+    if max_lng < 180.0:
+        edge |= index.lngs[ids] == max_lng
+    if y > 0:
+        edge |= index.lats[ids] == max_lat
+    ids = ids[~edge]
+
+    clusters = []
+    if z <= CLUSTER_MAX_ZOOM:
+        clusters, ids = cluster_points(ids, index.lats, index.lngs, store.coordinate_risk_codes, z)
+
+    systems = store.with_coordinates
+    # No dataset version in the body: the ETag is a hash of it, and must only change with the tile's contents
+    tile = {
+        "z": z,
+        "x": x,
+        "y": y,
+        "total": len(ids) + sum(c["count"] for c in clusters),
+        "clusters": clusters,
+        "systems": [{f: record[f] for f in TILE_FIELDS} for record in (systems[i] for i in ids)],
+    }
+    return encode_json(tile)
+
+
+class TileCache:
+    """LRU of encoded tiles keyed by dataset version and tile address"""
+
+    def __init__(self, max_tiles=4096):
+        self._tiles = LRUCache(max_tiles)
+
+    def get(self, store, z, x, y):
+        """
+        Return (body, etag), building the tile on first request. The ETag hashes the tile's contents,
+        so a reload that leaves a tile unchanged keeps it revalidating with 304 Not Modified
+        """
+        def build():
+            body = build_tile(store, z, x, y)
+            return body, hashlib.sha1(body).hexdigest()
+
+        return self._tiles.get_or_build((store.version, z, x, y), build)
+
+    def clear(self):
+        self._tiles.clear()
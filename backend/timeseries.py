@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+System Time Series
+Per-system, per-quarter population, violation counts and risk, stored as a columnar snapshot
+sorted by PWSID and quarter so one system's history is a contiguous, binary-searchable slice
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from snapshot import Snapshot, current_version_dir, write_snapshot
+
+TIMESERIES_DIR = os.path.join(os.path.dirname(__file__), 'data', 'timeseries')
+
+# Values recorded for every system and quarter
+SERIES_FIELDS = (
+    'population',
+    'is_active',
+    'total_violations',
+    'health_violations',
+    'unaddressed_violations',
+    'archived_violations',
+    'risk_level',
+)
+
+
+def write_timeseries(series, root=TIMESERIES_DIR):
+    """Publish a new time-series version from a frame with pwsid, quarter and SERIES_FIELDS"""
+    series = series.sort_values(['pwsid', 'quarter'], kind='stable').reset_index(drop=True)
+    return write_snapshot(series[['pwsid', 'quarter', *SERIES_FIELDS]], root)
+
+
+class TimeSeries:
+    """Read-only view of one time-series version"""
+
+    def __init__(self, directory):
+        self.version = os.path.basename(directory)
+        self._snapshot = Snapshot(directory)
+        self._pwsids = self._snapshot.shared_column('pwsid')
+        quarters = self._snapshot.shared_column('quarter')
+        self.quarters = [q.decode('utf-8') for q in np.unique(quarters.table[quarters.codes])]
+
+    def trend(self, pwsid):
+        """Quarterly points for one system, oldest first (empty if the system is unknown)"""
+        key = pwsid.strip().upper()
+        lo = int(np.searchsorted(self._pwsids, key, side='left'))
+        hi = int(np.searchsorted(self._pwsids, key, side='right'))
+        if lo == hi:
+            return []
+
+        rows = slice(lo, hi)
+        columns = {name: self._snapshot.column(name, rows) for name in ('quarter', *SERIES_FIELDS)}
+        return [
+            {name: (values[i].item() if isinstance(values[i], np.generic) else values[i])
+             for name, values in columns.items()}
+            for i in range(hi - lo)
+        ]
+
+
+_timeseries = None
+_timeseries_lock = threading.Lock()
+
+
+def get_timeseries(root=TIMESERIES_DIR):
+    """Current time-series version, reattached whenever preprocess_data.py publishes a new one"""
+    global _timeseries
+
+    directory = current_version_dir(root)
+    if directory is None:
+        raise FileNotFoundError("No quarterly time series found. Please run preprocess_data.py first.")
+
+    with _timeseries_lock:
+        if _timeseries is None or _timeseries.version != os.path.basename(directory):
+            _timeseries = TimeSeries(directory)
+        return _timeseries
@@ -9,6 +9,7 @@ const RegulatorFieldKit = () => {
   const [loading, setLoading] = useState(false);
   const [inspectionNotes, setInspectionNotes] = useState('');
   const [quickStats, setQuickStats] = useState(null);
+  const [nearbyCounty, setNearbyCounty] = useState(null);
 
   useEffect(() => {
     loadQuickStats();
@@ -40,6 +41,31 @@ const RegulatorFieldKit = () => {
     setLoading(false);
   };
 
+  // Systems nearest to the device's current position
+  const findNearbySystems = () => {
+    if (!navigator.geolocation) {
+      console.error('Geolocation is not available');
+      return;
+    }
+
+    setLoading(true);
+    navigator.geolocation.getCurrentPosition(async (position) => {
+      try {
+        const { latitude, longitude } = position.coords;
+        const response = await axios.get(`http://localhost:5000/api/nearby?lat=${latitude}&lng=${longitude}&k=20`);
+        setSearchResults(response.data.systems || []);
+        setNearbyCounty(response.data.county?.name || null);
+      } catch (error) {
+        console.error('Nearby lookup failed:', error);
+        setSearchResults([]);
+      }
+      setLoading(false);
+    }, (error) => {
+      console.error('Could not get current position:', error);
+      setLoading(false);
+    });
+  };
+
   useEffect(() => {
     const timeoutId = setTimeout(() => {
       searchSystems(searchTerm);
@@ -203,7 +229,7 @@ const RegulatorFieldKit = () => {
 
   const searchInputStyle = {
     width: '100%',
-    padding: '12px 16px 12px 44px',
+    padding: '12px 100px 12px 44px',
     backgroundColor: '#111827',
     border: '1px solid #374151',
     borderRadius: '8px',
@@ -299,9 +325,19 @@ const RegulatorFieldKit = () => {
             type="text"
             placeholder="Search by system name, PWSID, or location..."
             value={searchTerm}
-            onChange={(e) => setSearchTerm(e.target.value)}
+            onChange={(e) => {
+              setNearbyCounty(null);
+              setSearchTerm(e.target.value);
+            }}
             style={searchInputStyle}
           />
+          <button
+            onClick={findNearbySystems}
+            title="Find systems near my location"
+            style={{ position: 'absolute', right: '8px', top: '50%', transform: 'translateY(-50%)', display: 'flex', alignItems: 'center', gap: '4px', backgroundColor: '#374151', color: 'white', border: 'none', borderRadius: '6px', padding: '6px 10px', fontSize: '12px', cursor: 'pointer' }}
+          >
+            <MapPin size={14} /> Near me
+          </button>
         </div>
       </div>
 
@@ -318,7 +354,7 @@ const RegulatorFieldKit = () => {
           {searchResults.length > 0 && !loading && (
             <div style={{ backgroundColor: '#1f2937', borderRadius: '12px', padding: '20px', border: '1px solid #374151' }}>
               <h2 style={{ fontSize: '18px', fontWeight: '600', marginBottom: '16px' }}>
-                Search Results ({searchResults.length})
+                {nearbyCounty ? `Nearest Systems (${nearbyCounty} County)` : `Search Results (${searchResults.length})`}
               </h2>
               
               <div style={{ display: 'grid', gap: '8px' }}>
@@ -368,6 +404,7 @@ const RegulatorFieldKit = () => {
                     
                     <div style={{ fontSize: '11px', color: '#6b7280', marginTop: '4px' }}>
                       📍 {system.address}
+                      {system.distance_km != null && ` · ${system.distance_km.toFixed(1)} km away`}
                     </div>
                   </div>
                 ))}
@@ -64,6 +64,29 @@ const mapStyles = [
   }
 ];
 
+// Rebuild system objects from a /api/map-data?format=columnar block
+const decodeColumnarSystems = (block) => {
+  const bytes = Uint8Array.from(atob(block.coordinates || ''), c => c.charCodeAt(0));
+  const coordinates = new Float32Array(bytes.buffer);
+  const systems = new Array(block.count);
+
+  for (let i = 0; i < block.count; i++) {
+    const system = {};
+    for (const [field, values] of Object.entries(block.columns)) {
+      system[field] = values[i];
+    }
+    for (const [field, codes] of Object.entries(block.codes)) {
+      system[field] = codes[i] < 0 ? null : block.dictionaries[field][codes[i]];
+    }
+    if (block.coordinates) {
+      system.lat = coordinates[2 * i];
+      system.lng = coordinates[2 * i + 1];
+    }
+    systems[i] = system;
+  }
+  return systems;
+};
+
 const WaterSystemsMap = ({ onSystemSelect }) => {
   const [systems, setSystems] = useState([]);
   const [filteredSystems, setFilteredSystems] = useState([]);
@@ -76,10 +99,10 @@ const WaterSystemsMap = ({ onSystemSelect }) => {
   useEffect(() => {
     const fetchMapData = async () => {
       try {
-        // Use the new SDWIS pipeline endpoint
-        const response = await axios.get('http://localhost:5000/api/map-data');
+        // Columnar payload: parallel arrays are much smaller and faster to parse than one object per marker
+        const response = await axios.get('http://localhost:5000/api/map-data?format=columnar');
         
-        const systemsData = response.data.systems.map(system => ({
+        const systemsData = decodeColumnarSystems(response.data.systems).map(system => ({
           ...system,
           id: system.pwsid || system.id
         }));